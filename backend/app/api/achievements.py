@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.core.security import get_current_user
 from app.models import User, UserAchievement
 
@@ -10,9 +11,11 @@ router = APIRouter()
 @router.get("/my")
 async def get_my_achievements(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    rows = db.query(UserAchievement).filter(UserAchievement.user_id == current_user.id).order_by(UserAchievement.created_at.desc()).all()
+    rows = (await db.execute(
+        select(UserAchievement).where(UserAchievement.user_id == current_user.id).order_by(UserAchievement.created_at.desc())
+    )).scalars().all()
     return [
         {
             "id": ua.id,
@@ -28,9 +31,11 @@ async def get_my_achievements(
 async def get_user_achievements(
     user_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    rows = db.query(UserAchievement).filter(UserAchievement.user_id == user_id).order_by(UserAchievement.created_at.desc()).all()
+    rows = (await db.execute(
+        select(UserAchievement).where(UserAchievement.user_id == user_id).order_by(UserAchievement.created_at.desc())
+    )).scalars().all()
     return [
         {
             "id": ua.id,
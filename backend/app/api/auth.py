@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.core.security import get_current_user
 from app.models import User
 from app.schemas.user import User as UserSchema
@@ -11,7 +11,7 @@ router = APIRouter()
 @router.get("/me", response_model=UserSchema)
 async def get_current_user_info(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить информацию о текущем пользователе"""
     return current_user
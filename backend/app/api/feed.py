@@ -1,40 +1,83 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from uuid import UUID
+
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from app.db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy import desc, select, tuple_
+from app.db.database import get_async_db
 from app.core.security import get_current_user
 from app.models import User, Habit, FeedEvent, UserAchievement
 
 router = APIRouter()
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: datetime, event_id) -> str:
+    """Курсор страницы — позиция последнего события (created_at, id)."""
+    raw = f"{created_at.isoformat()}|{event_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, event_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), UUID(event_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 
 @router.get("")
 @router.get("/")
 async def get_feed(
+    before: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Лента событий для текущего пользователя"""
-    events = db.query(FeedEvent).filter(
-        FeedEvent.user_id == current_user.id
-    ).order_by(desc(FeedEvent.created_at)).limit(500).all()
-
-    result = []
-    for ev in events:
-        actor = db.query(User).filter(User.id == ev.actor_id).first() if ev.actor_id else None
-        habit = db.query(Habit).filter(Habit.id == ev.habit_id).first() if ev.habit_id else None
+    """
+    Лента событий для текущего пользователя, от новых к старым.
+
+    Keyset-пагинация по (created_at, id): before — next_cursor предыдущей страницы.
+    Автор, привычка и достижение (feed_events.achievement_id) подтягиваются JOIN'ом —
+    страница загружается одним запросом.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    actor_alias = aliased(User)
+
+    query = select(FeedEvent, actor_alias, Habit, UserAchievement).outerjoin(
+        actor_alias, actor_alias.id == FeedEvent.actor_id
+    ).outerjoin(
+        Habit, Habit.id == FeedEvent.habit_id
+    ).outerjoin(
+        UserAchievement, UserAchievement.id == FeedEvent.achievement_id
+    ).where(FeedEvent.user_id == current_user.id)
+    if before:
+        cursor_created_at, cursor_id = decode_cursor(before)
+        query = query.where(tuple_(FeedEvent.created_at, FeedEvent.id) < tuple_(cursor_created_at, cursor_id))
+    # limit + 1 строка — признак того, что есть следующая страница
+    rows = (await db.execute(
+        query.order_by(desc(FeedEvent.created_at), desc(FeedEvent.id)).limit(limit + 1)
+    )).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for ev, actor, habit, ach in rows:
         achievement = None
-        if ev.event_type == "achievement" and ev.actor_id:
-            ach = db.query(UserAchievement).filter(
-                UserAchievement.user_id == ev.actor_id
-            ).order_by(desc(UserAchievement.created_at)).first()
-            if ach:
-                achievement = {
-                    "type": ach.type,
-                    "tier": ach.tier,
-                    "created_at": ach.created_at,
-                }
-        result.append({
+        if ev.event_type == "achievement" and ach:
+            achievement = {
+                "type": ach.type,
+                "tier": ach.tier,
+                "created_at": ach.created_at,
+            }
+        items.append({
             "id": ev.id,
             "event_type": ev.event_type,
             "created_at": ev.created_at,
@@ -51,4 +94,9 @@ async def get_feed(
             } if actor else None,
             "achievement": achievement,
         })
-    return result
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return {"items": items, "next_cursor": next_cursor}
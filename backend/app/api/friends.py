@@ -1,28 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from uuid import UUID
 import secrets
-from app.db.database import get_db
+from app.db.database import get_async_db
 from app.core.security import get_current_user
 from app.core.config import settings
-from app.models import User, Friendship, FeedEvent, UserAchievement
-from sqlalchemy import func
+from app.models import User, Friendship, FriendEdge, FriendSuggestion
+from app.services import achievements, friends, suggestions
 from app.schemas.friendship import Friendship as FriendshipSchema, FriendshipCreate
 
 router = APIRouter()
 
-def ensure_referral_code(db: Session, user: User) -> str:
+DEFAULT_SUGGESTIONS = 20
+MAX_SUGGESTIONS = 50
+
+async def ensure_referral_code(db: AsyncSession, user: User) -> str:
     if getattr(user, "referral_code", None):
         return user.referral_code
 
     for _ in range(10):
         code = secrets.token_hex(8)  # 16 символов 0-9a-f, безопасно для /start payload
-        exists = db.query(User).filter(User.referral_code == code).first()
+        exists = (await db.execute(select(User.id).where(User.referral_code == code))).first()
         if not exists:
             user.referral_code = code
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
             return code
 
     raise HTTPException(status_code=500, detail="Failed to generate referral code")
@@ -31,10 +35,10 @@ def ensure_referral_code(db: Session, user: User) -> str:
 @router.get("/invite")
 async def get_invite_link(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить реферальную ссылку для приглашения друга."""
-    code = ensure_referral_code(db, current_user)
+    code = await ensure_referral_code(db, current_user)
     if not settings.TELEGRAM_BOT_USERNAME:
         raise HTTPException(status_code=500, detail="TELEGRAM_BOT_USERNAME is not configured")
     url = f"https://t.me/{settings.TELEGRAM_BOT_USERNAME}?start={code}"
@@ -44,19 +48,23 @@ async def get_invite_link(
 @router.get("", response_model=List[FriendshipSchema])
 async def get_friends(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить список друзей"""
-    friendships = db.query(Friendship).filter(
-        (Friendship.user_id == current_user.id) |
-        (Friendship.friend_id == current_user.id),
-        Friendship.status == "accepted"
-    ).all()
+    # Связи пользователя читаются индексом (user_id, status, friend_id), дружба и друг — JOIN'ом
+    rows = (await db.execute(
+        select(Friendship, User).select_from(FriendEdge).join(
+            Friendship, Friendship.id == FriendEdge.friendship_id
+        ).join(
+            User, User.id == FriendEdge.friend_id
+        ).where(
+            FriendEdge.user_id == current_user.id,
+            FriendEdge.status == "accepted",
+        )
+    )).all()
     
     result = []
-    for friendship in friendships:
-        friend_id = friendship.friend_id if friendship.user_id == current_user.id else friendship.user_id
-        friend = db.query(User).filter(User.id == friend_id).first()
+    for friendship, friend in rows:
         friendship_dict = {
             "id": friendship.id,
             "user_id": friendship.user_id,
@@ -78,25 +86,59 @@ async def get_friends(
     return result
 
 
+@router.get("/suggestions")
+async def get_suggestions(
+    limit: int = DEFAULT_SUGGESTIONS,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Возможные друзья: больше всего общих друзей и общих привычек.
+    Читается готовая таблица friend_suggestions, которая пересчитывается в фоне при изменении дружб.
+    """
+    limit = max(1, min(limit, MAX_SUGGESTIONS))
+    rows = (await db.execute(
+        select(FriendSuggestion, User).join(
+            User, User.id == FriendSuggestion.candidate_id
+        ).where(
+            FriendSuggestion.user_id == current_user.id
+        ).order_by(
+            desc(FriendSuggestion.score), desc(FriendSuggestion.mutual_friends)
+        ).limit(limit)
+    )).all()
+    return [
+        {
+            "user": {
+                "id": user.id,
+                "username": user.username,
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "bio": user.bio,
+                "avatar_emoji": user.avatar_emoji,
+            },
+            "mutual_friends": suggestion.mutual_friends,
+            "shared_habits": suggestion.shared_habits,
+        }
+        for suggestion, user in rows
+    ]
+
+
 @router.post("/{user_id}")
 async def add_friend(
     user_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Добавить друга"""
     if user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot add yourself as friend")
     
-    friend = db.query(User).filter(User.id == user_id).first()
+    friend = await db.get(User, user_id)
     if not friend:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Проверка существующей дружбы
-    existing = db.query(Friendship).filter(
-        ((Friendship.user_id == current_user.id) & (Friendship.friend_id == user_id)) |
-        ((Friendship.user_id == user_id) & (Friendship.friend_id == current_user.id))
-    ).first()
+    existing = await db.run_sync(friends.friendship_between, current_user.id, user_id)
     
     if existing:
         if existing.status == "accepted":
@@ -104,33 +146,12 @@ async def add_friend(
         elif existing.status == "pending":
             if existing.user_id == user_id:
                 existing.status = "accepted"
-                db.commit()
+                await db.run_sync(friends.save_edges, existing)
                 # Achievements: friends_count (3,7,10) for both parties
-                thresholds = [(1, 3), (2, 7), (3, 10)]
-                for uid in [current_user.id, user_id]:
-                    total_friends = db.query(func.count(Friendship.id)).filter(
-                        ((Friendship.user_id == uid) | (Friendship.friend_id == uid)),
-                        Friendship.status == "accepted"
-                    ).scalar() or 0
-                    for tier, th in thresholds:
-                        exists_ach = db.query(UserAchievement).filter(
-                            UserAchievement.user_id == uid,
-                            UserAchievement.type == "friends_count",
-                            UserAchievement.tier == tier
-                        ).first()
-                        if not exists_ach and total_friends >= th:
-                            db.add(UserAchievement(user_id=uid, type="friends_count", tier=tier, metadata_={"threshold": th}))
-                            # Create feed events for all of uid's accepted friends
-                            friend_rows = db.query(Friendship).filter(
-                                ((Friendship.user_id == uid) | (Friendship.friend_id == uid)),
-                                Friendship.status == "accepted"
-                            ).all()
-                            friend_ids = {fr.user_id if fr.user_id != uid else fr.friend_id for fr in friend_rows}
-                            for fid in friend_ids:
-                                db.add(FeedEvent(user_id=fid, actor_id=uid, habit_id=None, event_type="achievement"))
-                            # also add self event
-                            db.add(FeedEvent(user_id=uid, actor_id=uid, habit_id=None, event_type="achievement"))
-                            db.commit()
+                await db.run_sync(achievements.on_friendship_accepted, [current_user.id, user_id])
+                await db.run_sync(friends.invalidate, [current_user.id, user_id])
+                await db.run_sync(suggestions.schedule_friendship_changed, current_user.id, user_id)
+                await db.commit()
                 return {"message": "Friendship accepted"}
             else:
                 raise HTTPException(status_code=400, detail="Friendship request already sent")
@@ -142,8 +163,11 @@ async def add_friend(
         status="pending"
     )
     db.add(friendship)
-    db.commit()
-    db.refresh(friendship)
+    await db.run_sync(friends.save_edges, friendship)
+    await db.run_sync(friends.invalidate, [current_user.id, user_id])
+    await db.run_sync(suggestions.schedule_friendship_changed, current_user.id, user_id)
+    await db.commit()
+    await db.refresh(friendship)
     
     return {"message": "Friendship request sent", "friendship": friendship}
 
@@ -152,18 +176,20 @@ async def add_friend(
 async def remove_friend(
     user_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Удалить друга"""
-    friendship = db.query(Friendship).filter(
-        ((Friendship.user_id == current_user.id) & (Friendship.friend_id == user_id)) |
-        ((Friendship.user_id == user_id) & (Friendship.friend_id == current_user.id))
-    ).first()
+    friendship = await db.run_sync(friends.friendship_between, current_user.id, user_id)
     
     if not friendship:
         raise HTTPException(status_code=404, detail="Friendship not found")
     
-    db.delete(friendship)
-    db.commit()
+    was_accepted = friendship.status == "accepted"
+    await db.delete(friendship)
+    if was_accepted:
+        await db.run_sync(achievements.on_friendship_removed, [current_user.id, user_id])
+    await db.run_sync(friends.invalidate, [current_user.id, user_id])
+    await db.run_sync(suggestions.schedule_friendship_changed, current_user.id, user_id)
+    await db.commit()
     return {"message": "Friend removed"}
 
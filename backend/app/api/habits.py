@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import List
 from uuid import UUID
-from datetime import date, timedelta, datetime, time, timezone
-from app.db.database import get_db
+from datetime import date, datetime, time, timezone
+from app.db.database import get_async_db
 from app.core.security import get_current_user
-from app.models import User, Habit, HabitParticipant, HabitLog, FeedEvent, UserAchievement, Friendship
+from app.services.habit_loader import build_habit_payloads
+from app.services import achievements, calendar, feed, reminders, rollups, streaks, suggestions
+from app.models import User, Habit, HabitParticipant, HabitLog, FeedEvent
 from app.schemas.habit import (
     Habit as HabitSchema,
     HabitCreate,
@@ -21,157 +24,38 @@ router = APIRouter()
 ALL_COLORS = ["gray", "silver", "gold", "emerald", "sapphire", "ruby"]
 
 
+async def _accepted_ids(db: AsyncSession, habit_id: UUID) -> List[UUID]:
+    """Принявшие участники привычки."""
+    return list((await db.execute(select(HabitParticipant.user_id).where(
+        HabitParticipant.habit_id == habit_id,
+        HabitParticipant.status == "accepted",
+    ))).scalars().all())
+
+
 @router.get("", response_model=List[HabitSchema])
 async def get_habits(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить все привычки пользователя"""
     # Привычки, созданные пользователем или где он участник
-    habits = db.query(Habit).filter(
+    habits = (await db.execute(select(Habit).where(
         (Habit.created_by == current_user.id) |
         (Habit.id.in_(
-            db.query(HabitParticipant.habit_id).filter(
+            select(HabitParticipant.habit_id).where(
                 HabitParticipant.user_id == current_user.id
             )
         ))
-    ).all()
+    ))).scalars().all()
     
-    # Текущая неделя (пн–вс) для отображения выполнений
-    today = date.today()
-    week_start = today - timedelta(days=today.weekday())  # понедельник
-    week_end = week_start + timedelta(days=6)
-
-    result = []
-    for habit in habits:
-        participants = db.query(HabitParticipant).filter(
-            HabitParticipant.habit_id == habit.id
-        ).all()
-        # users cache by id
-        users_by_id = {}
-        for p in participants:
-            if p.user_id not in users_by_id:
-                users_by_id[p.user_id] = db.query(User).filter(User.id == p.user_id).first()
-        week_logs = db.query(func.date(HabitLog.completed_at)).filter(
-            HabitLog.habit_id == habit.id,
-            HabitLog.user_id == current_user.id,
-            func.date(HabitLog.completed_at) >= week_start,
-            func.date(HabitLog.completed_at) <= week_end,
-        ).distinct().all()
-        current_week_completions = [str(d[0]) for d in week_logs]
-
-        participants_by_user = {p.user_id: p for p in participants}
-        accepted_participant_ids = [
-            p.user_id for p in participants if getattr(p, "status", "accepted") == "accepted"
-        ]
-
-        weekly_participant_completions = {}
-        if accepted_participant_ids:
-            week_logs_all = db.query(
-                func.date(HabitLog.completed_at).label("date"),
-                HabitLog.user_id,
-            ).filter(
-                HabitLog.habit_id == habit.id,
-                HabitLog.user_id.in_(accepted_participant_ids),
-                func.date(HabitLog.completed_at) >= week_start,
-                func.date(HabitLog.completed_at) <= week_end,
-            ).all()
-
-            for row in week_logs_all:
-                day = str(row[0])
-                uid = row[1]
-                participant = participants_by_user.get(uid)
-                color = getattr(participant, "color", None) if participant else None
-                if day not in weekly_participant_completions:
-                    weekly_participant_completions[day] = []
-                weekly_participant_completions[day].append(
-                    {"user_id": uid, "color": color}
-                )
-
-        max_streak = 0
-        if accepted_participant_ids:
-            common_dates = None
-            for uid in accepted_participant_ids:
-                rows = db.query(func.date(HabitLog.completed_at)).filter(
-                    HabitLog.habit_id == habit.id,
-                    HabitLog.user_id == uid,
-                ).group_by(func.date(HabitLog.completed_at)).order_by(func.date(HabitLog.completed_at)).all()
-                dates = [row[0] for row in rows]
-                date_set = set(dates)
-                if common_dates is None:
-                    common_dates = date_set
-                else:
-                    common_dates &= date_set
-            if common_dates:
-                ordered = sorted(common_dates)
-                cur = 1
-                max_streak = 1
-                for i in range(1, len(ordered)):
-                    if (ordered[i] - ordered[i - 1]).days == 1:
-                        cur += 1
-                        if cur > max_streak:
-                            max_streak = cur
-                    else:
-                        cur = 1
-
-        has_pending_invites = False
-        is_invited = False
-        for p in participants:
-            if p.user_id == current_user.id and getattr(p, "status", "accepted") == "pending":
-                is_invited = True
-            if habit.created_by == current_user.id and p.user_id != current_user.id and getattr(p, "status", "accepted") == "pending":
-                has_pending_invites = True
-
-        habit_dict = {
-            "id": habit.id,
-            "name": habit.name,
-            "description": habit.description,
-            "frequency": habit.frequency,
-            "is_shared": habit.is_shared,
-            "created_by": habit.created_by,
-            "created_at": habit.created_at,
-            "updated_at": habit.updated_at,
-            "color": getattr(habit, "color", None),
-            "days_of_week": getattr(habit, "days_of_week", None),
-            "weekly_goal_days": getattr(habit, "weekly_goal_days", None),
-            "reminder_enabled": getattr(habit, "reminder_enabled", None),
-            "reminder_time": getattr(habit, "reminder_time", None),
-            "participants": [
-                {
-                    "id": p.user_id,
-                    "joined_at": p.joined_at,
-                    "status": getattr(p, "status", "accepted"),
-                    "color": getattr(p, "color", None),
-                    "reminder_enabled": getattr(p, "reminder_enabled", None),
-                    "reminder_time": getattr(p, "reminder_time", None),
-                    "user": (lambda u: {
-                        "id": u.id,
-                        "username": u.username,
-                        "first_name": u.first_name,
-                        "last_name": u.last_name,
-                        "avatar_emoji": u.avatar_emoji,
-                        "bio": u.bio,
-                    } if u else None)(users_by_id.get(p.user_id)),
-                }
-                for p in participants
-            ],
-            "current_week_completions": current_week_completions,
-            "current_streak": max_streak,
-            "has_pending_invites": has_pending_invites,
-            "is_invited": is_invited,
-            "can_edit": habit.created_by == current_user.id,
-            "weekly_participant_completions": weekly_participant_completions,
-        }
-        result.append(habit_dict)
-
-    return result
+    return await db.run_sync(build_habit_payloads, habits, current_user)
 
 
 @router.post("", response_model=HabitSchema)
 async def create_habit(
     habit_data: HabitCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Создать новую привычку"""
     habit = Habit(
@@ -191,8 +75,8 @@ async def create_habit(
         db.add(current_user)
 
     db.add(habit)
-    db.commit()
-    db.refresh(habit)
+    await db.commit()
+    await db.refresh(habit)
 
     participant = HabitParticipant(
         habit_id=habit.id,
@@ -203,6 +87,7 @@ async def create_habit(
         reminder_time=habit.reminder_time,
     )
     db.add(participant)
+    await db.run_sync(reminders.sync_participant, participant)
 
     if habit_data.is_shared and habit_data.participant_ids:
         unique_ids = {pid for pid in habit_data.participant_ids if pid != current_user.id}
@@ -223,8 +108,8 @@ async def create_habit(
                 event_type="invited",
             ))
 
-    db.commit()
-    db.refresh(habit)
+    await db.commit()
+    await db.refresh(habit)
 
     return await get_habit(habit.id, current_user, db)
 
@@ -233,76 +118,24 @@ async def create_habit(
 async def get_habit(
     habit_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить детали привычки"""
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
 
     # Проверка доступа
     if habit.created_by != current_user.id:
-        participant = db.query(HabitParticipant).filter(
+        participant = (await db.execute(select(HabitParticipant).where(
             HabitParticipant.habit_id == habit_id,
             HabitParticipant.user_id == current_user.id
-        ).first()
+        ))).scalars().first()
         if not participant:
             raise HTTPException(status_code=403, detail="Access denied")
 
-    participants = db.query(HabitParticipant).filter(
-        HabitParticipant.habit_id == habit.id
-    ).all()
-    users_by_id = {}
-    for p in participants:
-        if p.user_id not in users_by_id:
-            users_by_id[p.user_id] = db.query(User).filter(User.id == p.user_id).first()
-
-    has_pending_invites = False
-    is_invited = False
-    for p in participants:
-        if p.user_id == current_user.id and getattr(p, "status", "accepted") == "pending":
-            is_invited = True
-        if habit.created_by == current_user.id and p.user_id != current_user.id and getattr(p, "status", "accepted") == "pending":
-            has_pending_invites = True
-
-    habit_dict = {
-        "id": habit.id,
-        "name": habit.name,
-        "description": habit.description,
-        "frequency": habit.frequency,
-        "is_shared": habit.is_shared,
-        "created_by": habit.created_by,
-        "created_at": habit.created_at,
-        "updated_at": habit.updated_at,
-        "color": getattr(habit, "color", None),
-        "days_of_week": getattr(habit, "days_of_week", None),
-        "weekly_goal_days": getattr(habit, "weekly_goal_days", None),
-        "reminder_enabled": getattr(habit, "reminder_enabled", None),
-        "reminder_time": getattr(habit, "reminder_time", None),
-        "participants": [
-            {
-                "id": p.user_id,
-                "joined_at": p.joined_at,
-                "status": getattr(p, "status", "accepted"),
-                "color": getattr(p, "color", None),
-                "reminder_enabled": getattr(p, "reminder_enabled", None),
-                "reminder_time": getattr(p, "reminder_time", None),
-                "user": (lambda u: {
-                    "id": u.id,
-                    "username": u.username,
-                    "first_name": u.first_name,
-                    "last_name": u.last_name,
-                    "avatar_emoji": u.avatar_emoji,
-                    "bio": u.bio,
-                } if u else None)(users_by_id.get(p.user_id)),
-            }
-            for p in participants
-        ],
-        "has_pending_invites": has_pending_invites,
-        "is_invited": is_invited,
-        "can_edit": habit.created_by == current_user.id,
-    }
-    return habit_dict
+    payloads = await db.run_sync(build_habit_payloads, [habit], current_user, with_progress=False)
+    return payloads[0]
 
 
 @router.put("/{habit_id}", response_model=HabitSchema)
@@ -310,10 +143,10 @@ async def update_habit(
     habit_id: UUID,
     habit_data: HabitUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Обновить привычку"""
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
 
@@ -341,16 +174,16 @@ async def update_habit(
             continue
         setattr(habit, field, value)
 
-    db.commit()
-    db.refresh(habit)
+    await db.commit()
+    await db.refresh(habit)
 
     new_color = getattr(habit, "color", None)
     if "color" in update_data and new_color and new_color != old_color:
-        db.query(HabitParticipant).filter(
+        await db.execute(update(HabitParticipant).where(
             HabitParticipant.habit_id == habit_id,
             HabitParticipant.user_id == current_user.id,
-        ).update({"color": new_color})
-        db.commit()
+        ).values(color=new_color))
+        await db.commit()
 
     # Sync reminder settings to creator's participant record
     if "reminder_enabled" in update_data or "reminder_time" in update_data:
@@ -360,11 +193,16 @@ async def update_habit(
         if "reminder_time" in update_data:
             update_fields["reminder_time"] = update_data["reminder_time"]
             
-        db.query(HabitParticipant).filter(
+        await db.execute(update(HabitParticipant).where(
             HabitParticipant.habit_id == habit_id,
             HabitParticipant.user_id == current_user.id,
-        ).update(update_fields)
-        db.commit()
+        ).values(**update_fields))
+        await db.commit()
+
+    # Расписание или напоминание изменилось — пересобрать минутные слоты напоминаний участников
+    if {"days_of_week", "weekly_goal_days", "reminder_enabled", "reminder_time"} & update_data.keys():
+        await db.run_sync(reminders.sync_habit, habit)
+        await db.commit()
 
     return await get_habit(habit_id, current_user, db)
 
@@ -373,18 +211,28 @@ async def update_habit(
 async def delete_habit(
     habit_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Удалить привычку"""
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
     
     if habit.created_by != current_user.id:
         raise HTTPException(status_code=403, detail="Удалять привычку может только её создатель")
     
-    db.delete(habit)
-    db.commit()
+    participants = (await db.execute(
+        select(HabitParticipant.user_id, HabitParticipant.status).where(HabitParticipant.habit_id == habit_id)
+    )).all()
+    participant_ids = [p.user_id for p in participants]
+    await db.delete(habit)
+    # вместе с привычкой удаляются логи участников — пересчитываем их total_days
+    await db.run_sync(achievements.recount_days, participant_ids)
+    await db.run_sync(
+        suggestions.schedule_habit_regrouped,
+        [p.user_id for p in participants if p.status == "accepted"],
+    )
+    await db.commit()
     return {"message": "Habit deleted"}
 
 
@@ -393,23 +241,23 @@ async def accept_invitation(
     habit_id: UUID,
     payload: dict = Body(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
 
-    participant = db.query(HabitParticipant).filter(
+    participant = (await db.execute(select(HabitParticipant).where(
         HabitParticipant.habit_id == habit_id,
         HabitParticipant.user_id == current_user.id,
-    ).first()
+    ))).scalars().first()
     if not participant or getattr(participant, "status", "accepted") != "pending":
         raise HTTPException(status_code=400, detail="No pending invitation for this habit")
 
-    accepted_count = db.query(func.count(HabitParticipant.id)).filter(
+    accepted_count = await db.scalar(select(func.count(HabitParticipant.id)).where(
         HabitParticipant.habit_id == habit_id,
         HabitParticipant.status == "accepted",
-    ).scalar()
+    ))
     if accepted_count >= 6:
         raise HTTPException(status_code=400, detail="Maximum participants reached for this habit")
 
@@ -419,10 +267,10 @@ async def accept_invitation(
         if isinstance(value, str):
             requested_color = value
 
-    accepted_participants = db.query(HabitParticipant).filter(
+    accepted_participants = (await db.execute(select(HabitParticipant).where(
         HabitParticipant.habit_id == habit_id,
         HabitParticipant.status == "accepted",
-    ).all()
+    ))).scalars().all()
     used_colors = {p.color for p in accepted_participants if p.color}
 
     color = requested_color
@@ -434,7 +282,13 @@ async def accept_invitation(
 
     participant.status = "accepted"
     participant.color = color
-    db.commit()
+    await db.run_sync(reminders.sync_participant, participant)
+    # новый участник меняет набор дней совместной серии
+    await db.run_sync(streaks.recompute_joint_streak, habit_id)
+    await db.run_sync(
+        suggestions.schedule_habit_regrouped,
+        [p.user_id for p in accepted_participants] + [current_user.id],
+    )
     # feed: joined -> for creator
     db.add(FeedEvent(
         user_id=habit.created_by,
@@ -442,34 +296,11 @@ async def accept_invitation(
         habit_id=habit_id,
         event_type="joined",
     ))
-    db.commit()
 
-    # Achievements: habit_invites (1,3,5) for owner on any single habit
+    # Achievements: habit_invites (1,3,5) for owner on any single habit (проверка — в фоне)
     if habit.created_by:
-        accepted_count = db.query(func.count(HabitParticipant.id)).filter(
-            HabitParticipant.habit_id == habit_id,
-            HabitParticipant.status == "accepted",
-        ).scalar() or 0
-        owner_id = habit.created_by
-        thresholds_invites = [(1, 1), (2, 3), (3, 5)]
-        for tier, th in thresholds_invites:
-            exists = db.query(UserAchievement).filter(
-                UserAchievement.user_id == owner_id,
-                UserAchievement.type == "habit_invites",
-                UserAchievement.tier == tier
-            ).first()
-            if not exists and accepted_count >= th:
-                db.add(UserAchievement(user_id=owner_id, type="habit_invites", tier=tier, metadata_={"threshold": th, "habit_id": str(habit_id)}))
-                # notify owner's friends
-                friend_rows = db.query(Friendship).filter(
-                    ((Friendship.user_id == owner_id) | (Friendship.friend_id == owner_id)),
-                    Friendship.status == "accepted"
-                ).all()
-                friend_ids = {fr.user_id if fr.user_id != owner_id else fr.friend_id for fr in friend_rows}
-                for fid in friend_ids:
-                    db.add(FeedEvent(user_id=fid, actor_id=owner_id, habit_id=habit_id, event_type="achievement"))
-                db.add(FeedEvent(user_id=owner_id, actor_id=owner_id, habit_id=habit_id, event_type="achievement"))
-                db.commit()
+        await db.run_sync(achievements.on_invitation_accepted, habit.created_by, habit_id, accepted_count + 1)
+    await db.commit()
 
     return await get_habit(habit_id, current_user, db)
 
@@ -478,21 +309,21 @@ async def accept_invitation(
 async def decline_invitation(
     habit_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
 
-    participant = db.query(HabitParticipant).filter(
+    participant = (await db.execute(select(HabitParticipant).where(
         HabitParticipant.habit_id == habit_id,
         HabitParticipant.user_id == current_user.id,
-    ).first()
+    ))).scalars().first()
     if not participant or getattr(participant, "status", "accepted") != "pending":
         raise HTTPException(status_code=400, detail="No pending invitation for this habit")
 
-    db.delete(participant)
-    db.commit()
+    await db.delete(participant)
+    await db.commit()
     # feed: declined -> for creator
     db.add(FeedEvent(
         user_id=habit.created_by,
@@ -500,7 +331,7 @@ async def decline_invitation(
         habit_id=habit_id,
         event_type="declined",
     ))
-    db.commit()
+    await db.commit()
     return {"message": "Invitation declined"}
 
 
@@ -509,19 +340,19 @@ async def complete_habit(
     habit_id: UUID,
     log_data: HabitLogCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Отметить выполнение привычки (за сегодня или за указанную дату)."""
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
 
     if habit.created_by != current_user.id:
-        participant = db.query(HabitParticipant).filter(
+        participant = (await db.execute(select(HabitParticipant).where(
             HabitParticipant.habit_id == habit_id,
             HabitParticipant.user_id == current_user.id,
             HabitParticipant.status == "accepted",
-        ).first()
+        ))).scalars().first()
         if not participant:
             raise HTTPException(status_code=403, detail="Access denied")
 
@@ -532,117 +363,36 @@ async def complete_habit(
         except (ValueError, TypeError):
             raise HTTPException(status_code=400, detail="Invalid date format (use YYYY-MM-DD)")
 
-    existing_log = db.query(HabitLog).filter(
-        HabitLog.habit_id == habit_id,
-        HabitLog.user_id == current_user.id,
-        func.date(HabitLog.completed_at) == target_date
-    ).first()
-
-    if existing_log:
+    # Одна транзакция: вставка лога через INSERT ... ON CONFLICT DO NOTHING по уникальному
+    # дневному индексу idx_habit_logs_habit_user_date вместо SELECT + INSERT.
+    completed_at = datetime.combine(target_date, time(12, 0), tzinfo=timezone.utc)
+    log = (await db.scalars(
+        pg_insert(HabitLog)
+        .values(
+            habit_id=habit_id,
+            user_id=current_user.id,
+            notes=log_data.notes,
+            completed_at=completed_at,
+        )
+        .on_conflict_do_nothing()
+        .returning(HabitLog)
+    )).first()
+
+    if log is None:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Habit already completed for this date")
 
-    completed_at = datetime.combine(target_date, time(12, 0), tzinfo=timezone.utc)
-    log = HabitLog(
-        habit_id=habit_id,
-        user_id=current_user.id,
-        notes=log_data.notes,
-        completed_at=completed_at,
-    )
-    db.add(log)
-    db.commit()
-    db.refresh(log)
-    # feed: completed -> for actor, other accepted participants и создателя
-    db.add(FeedEvent(
-        user_id=current_user.id,
-        actor_id=current_user.id,
-        habit_id=habit_id,
-        event_type="completed",
-    ))
-    
-    if habit.is_shared:
-        accepted = db.query(HabitParticipant).filter(
-            HabitParticipant.habit_id == habit_id,
-            HabitParticipant.status == "accepted",
-        ).all()
-        
-        # Collect unique recipients to avoid duplicates
-        recipient_ids = set()
-        for p in accepted:
-            if p.user_id != current_user.id:
-                recipient_ids.add(p.user_id)
-        
-        # Add creator if not already included (though they should be in accepted)
-        if habit.created_by != current_user.id:
-            recipient_ids.add(habit.created_by)
-            
-        for recipient_id in recipient_ids:
-            db.add(FeedEvent(
-                user_id=recipient_id,
-                actor_id=current_user.id,
-                habit_id=habit_id,
-                event_type="completed",
-            ))
-    db.commit()
-
-    # Achievements: total_days (7,14,21)
-    total_days = db.query(func.count(func.distinct(func.date(HabitLog.completed_at)))).filter(
-        HabitLog.user_id == current_user.id
-    ).scalar() or 0
-    thresholds_total = [(1, 7), (2, 14), (3, 21)]
-    for tier, th in thresholds_total:
-        exists = db.query(UserAchievement).filter(
-            UserAchievement.user_id == current_user.id,
-            UserAchievement.type == "total_days",
-            UserAchievement.tier == tier
-        ).first()
-        if not exists and total_days >= th:
-            db.add(UserAchievement(user_id=current_user.id, type="total_days", tier=tier, metadata_={"threshold": th}))
-            # feed: achievement -> for all friends and self
-            friend_rows = db.query(Friendship).filter(
-                ((Friendship.user_id == current_user.id) | (Friendship.friend_id == current_user.id)),
-                Friendship.status == "accepted"
-            ).all()
-            friend_ids = {fr.user_id if fr.user_id != current_user.id else fr.friend_id for fr in friend_rows}
-            for fid in friend_ids:
-                db.add(FeedEvent(user_id=fid, actor_id=current_user.id, habit_id=None, event_type="achievement"))
-            db.add(FeedEvent(user_id=current_user.id, actor_id=current_user.id, habit_id=None, event_type="achievement"))
-            db.commit()
-
-    # Achievements: streak (5,15,30) for any single habit
-    # compute current streak for this habit for the current user
-    rows = db.query(func.date(HabitLog.completed_at)).filter(
-        HabitLog.habit_id == habit_id,
-        HabitLog.user_id == current_user.id,
-    ).group_by(func.date(HabitLog.completed_at)).order_by(func.date(HabitLog.completed_at)).all()
-    dates = [r[0] for r in rows]
-    streak = 0
-    if dates:
-        # count consecutive days ending at target_date
-        target = target_date
-        s = 0
-        dset = set(dates)
-        while target in dset:
-            s += 1
-            target = target - timedelta(days=1)
-        streak = s
-    thresholds_streak = [(1, 5), (2, 15), (3, 30)]
-    for tier, th in thresholds_streak:
-        exists = db.query(UserAchievement).filter(
-            UserAchievement.user_id == current_user.id,
-            UserAchievement.type == "streak",
-            UserAchievement.tier == tier
-        ).first()
-        if not exists and streak >= th:
-            db.add(UserAchievement(user_id=current_user.id, type="streak", tier=tier, metadata_={"threshold": th, "habit_id": str(habit_id)}))
-            friend_rows = db.query(Friendship).filter(
-                ((Friendship.user_id == current_user.id) | (Friendship.friend_id == current_user.id)),
-                Friendship.status == "accepted"
-            ).all()
-            friend_ids = {fr.user_id if fr.user_id != current_user.id else fr.friend_id for fr in friend_rows}
-            for fid in friend_ids:
-                db.add(FeedEvent(user_id=fid, actor_id=current_user.id, habit_id=habit_id, event_type="achievement"))
-            db.add(FeedEvent(user_id=current_user.id, actor_id=current_user.id, habit_id=habit_id, event_type="achievement"))
-            db.commit()
+    await db.run_sync(calendar.mark_day, habit_id, current_user.id, target_date)
+    await db.run_sync(rollups.record_day, habit_id, current_user.id, target_date)
+    streak = await db.run_sync(streaks.record_completion, habit_id, current_user.id, target_date)
+
+    # Рассылка в ленту и проверка достижений — фоновые задачи в той же транзакции,
+    # время ответа не зависит от числа участников и друзей.
+    await db.run_sync(feed.schedule_completed, habit_id, current_user.id)
+    # Achievements: total_days (7,14,21) и streak (5,15,30) по счётчикам user_counters
+    await db.run_sync(achievements.on_completion, current_user.id, target_date, streak, habit_id)
+
+    await db.commit()
     return log
 
 
@@ -651,10 +401,10 @@ async def invite_participants(
     habit_id: UUID,
     payload: dict = Body(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Пригласить дополнительных друзей в привычку (создатель)."""
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
     if habit.created_by != current_user.id:
@@ -664,7 +414,9 @@ async def invite_participants(
         raise HTTPException(status_code=400, detail="user_ids must be a list")
     user_ids = [uid for uid in user_ids if uid and uid != str(current_user.id)]
 
-    existing = db.query(HabitParticipant).filter(HabitParticipant.habit_id == habit_id).all()
+    existing = (await db.execute(
+        select(HabitParticipant).where(HabitParticipant.habit_id == habit_id)
+    )).scalars().all()
     existing_ids = {str(p.user_id) for p in existing}
     to_add = [uid for uid in user_ids if uid not in existing_ids]
 
@@ -683,7 +435,7 @@ async def invite_participants(
             habit_id=habit_id,
             event_type="invited",
         ))
-    db.commit()
+    await db.commit()
     return await get_habit(habit_id, current_user, db)
 
 
@@ -692,35 +444,41 @@ async def remove_participant(
     habit_id: UUID,
     user_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Удалить участника из привычки (создатель). Удаляет также его отметки для этой привычки."""
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
     if habit.created_by != current_user.id:
         raise HTTPException(status_code=403, detail="Only creator can remove participants")
 
-    participant = db.query(HabitParticipant).filter(
+    participant = (await db.execute(select(HabitParticipant).where(
         HabitParticipant.habit_id == habit_id,
         HabitParticipant.user_id == user_id,
-    ).first()
+    ))).scalars().first()
     if not participant:
         raise HTTPException(status_code=404, detail="Participant not found")
 
-    db.query(HabitLog).filter(
+    await db.execute(delete(HabitLog).where(
         HabitLog.habit_id == habit_id,
         HabitLog.user_id == user_id,
-    ).delete()
-    db.delete(participant)
-    db.commit()
+    ))
+    await db.delete(participant)
+    await db.run_sync(calendar.drop_user, habit_id, user_id)
+    await db.run_sync(rollups.drop_user, habit_id, user_id)
+    await db.run_sync(streaks.drop_participant, habit_id, user_id)
+    await db.run_sync(achievements.recount_days, [user_id])
+    if participant.status == "accepted":
+        await db.run_sync(suggestions.schedule_habit_regrouped, await _accepted_ids(db, habit_id) + [user_id])
+    await db.commit()
     db.add(FeedEvent(
         user_id=user_id,
         actor_id=current_user.id,
         habit_id=habit_id,
         event_type="removed",
     ))
-    db.commit()
+    await db.commit()
     return await get_habit(habit_id, current_user, db)
 
 
@@ -728,30 +486,35 @@ async def remove_participant(
 async def leave_habit(
     habit_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Участник выходит из привычки. Все его отметки по этой привычке удаляются."""
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
     # создатель не может выйти таким образом
     if habit.created_by == current_user.id:
         raise HTTPException(status_code=400, detail="Creator cannot leave own habit")
 
-    participant = db.query(HabitParticipant).filter(
+    participant = (await db.execute(select(HabitParticipant).where(
         HabitParticipant.habit_id == habit_id,
         HabitParticipant.user_id == current_user.id,
         HabitParticipant.status == "accepted",
-    ).first()
+    ))).scalars().first()
     if not participant:
         raise HTTPException(status_code=404, detail="You are not a participant of this habit")
 
-    db.query(HabitLog).filter(
+    await db.execute(delete(HabitLog).where(
         HabitLog.habit_id == habit_id,
         HabitLog.user_id == current_user.id,
-    ).delete()
-    db.delete(participant)
-    db.commit()
+    ))
+    await db.delete(participant)
+    await db.run_sync(calendar.drop_user, habit_id, current_user.id)
+    await db.run_sync(rollups.drop_user, habit_id, current_user.id)
+    await db.run_sync(streaks.drop_participant, habit_id, current_user.id)
+    await db.run_sync(achievements.recount_days, [current_user.id])
+    await db.run_sync(suggestions.schedule_habit_regrouped, await _accepted_ids(db, habit_id) + [current_user.id])
+    await db.commit()
     # feed: left -> for creator
     db.add(FeedEvent(
         user_id=habit.created_by,
@@ -759,7 +522,7 @@ async def leave_habit(
         habit_id=habit_id,
         event_type="left",
     ))
-    db.commit()
+    await db.commit()
     return {"message": "Left the habit"}
 
 
@@ -768,19 +531,19 @@ async def remove_habit_log(
     habit_id: UUID,
     log_date: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Убрать отметку о выполнении за указанную дату (YYYY-MM-DD)."""
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
 
     if habit.created_by != current_user.id:
-        participant = db.query(HabitParticipant).filter(
+        participant = (await db.execute(select(HabitParticipant).where(
             HabitParticipant.habit_id == habit_id,
             HabitParticipant.user_id == current_user.id,
             HabitParticipant.status == "accepted",
-        ).first()
+        ))).scalars().first()
         if not participant:
             raise HTTPException(status_code=403, detail="Access denied")
 
@@ -789,17 +552,21 @@ async def remove_habit_log(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format (use YYYY-MM-DD)")
 
-    log = db.query(HabitLog).filter(
+    log = (await db.execute(select(HabitLog).where(
         HabitLog.habit_id == habit_id,
         HabitLog.user_id == current_user.id,
-        func.date(HabitLog.completed_at) == target_date
-    ).first()
+        HabitLog.completed_date == target_date
+    ))).scalars().first()
 
     if not log:
         raise HTTPException(status_code=404, detail="No completion for this date")
 
-    db.delete(log)
-    db.commit()
+    await db.delete(log)
+    await db.run_sync(calendar.clear_day, habit_id, current_user.id, target_date)
+    await db.run_sync(rollups.remove_day, habit_id, current_user.id, target_date)
+    await db.run_sync(streaks.record_removal, habit_id, current_user.id, target_date)
+    await db.run_sync(achievements.on_log_removed, current_user.id, target_date)
+    await db.commit()
     return {"message": "Completion removed"}
 
 
@@ -808,18 +575,18 @@ async def update_my_participation(
     habit_id: UUID,
     data: HabitParticipantUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Обновить свои настройки в привычке (цвет, напоминание)."""
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
 
-    participant = db.query(HabitParticipant).filter(
+    participant = (await db.execute(select(HabitParticipant).where(
         HabitParticipant.habit_id == habit_id,
         HabitParticipant.user_id == current_user.id,
         HabitParticipant.status == "accepted",
-    ).first()
+    ))).scalars().first()
     if not participant:
         raise HTTPException(status_code=403, detail="You are not a participant of this habit")
 
@@ -830,10 +597,12 @@ async def update_my_participation(
         if new_color not in ALL_COLORS:
             raise HTTPException(status_code=400, detail="Invalid color")
         
-        used_colors = {
-            p.color for p in habit.participants 
-            if p.user_id != current_user.id and p.status == "accepted" and p.color
-        }
+        other_colors = (await db.execute(select(HabitParticipant.color).where(
+            HabitParticipant.habit_id == habit_id,
+            HabitParticipant.user_id != current_user.id,
+            HabitParticipant.status == "accepted",
+        ))).scalars().all()
+        used_colors = {c for c in other_colors if c}
         if new_color in used_colors:
             raise HTTPException(status_code=400, detail="This color is already taken by another participant")
         
@@ -845,8 +614,11 @@ async def update_my_participation(
     if "reminder_time" in update_data:
         participant.reminder_time = update_data["reminder_time"]
 
-    db.commit()
-    db.refresh(participant)
+    if "reminder_enabled" in update_data or "reminder_time" in update_data:
+        await db.run_sync(reminders.sync_participant, participant)
+
+    await db.commit()
+    await db.refresh(participant)
 
     return await get_habit(habit_id, current_user, db)
 
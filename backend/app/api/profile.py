@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, select
+from app.db.database import get_async_db
 from app.core.security import get_current_user
-from app.models import User
+from app.models import User, Habit, HabitParticipant, Friendship, FriendEdge
+from app.services import achievements, friends, reminders, streaks, suggestions
 from app.schemas.user import User as UserSchema, UserUpdate
 
 router = APIRouter()
@@ -11,7 +13,7 @@ router = APIRouter()
 @router.get("", response_model=UserSchema)
 async def get_profile(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить профиль пользователя"""
     return current_user
@@ -21,25 +23,57 @@ async def get_profile(
 async def update_profile(
     profile_data: UserUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Обновить профиль пользователя"""
-    for field, value in profile_data.dict(exclude_unset=True).items():
+    update_data = profile_data.dict(exclude_unset=True)
+    new_timezone = update_data.get("timezone")
+    if new_timezone is not None and not reminders.is_valid_timezone(new_timezone):
+        raise HTTPException(status_code=400, detail="Invalid timezone")
+    timezone_changed = new_timezone is not None and new_timezone != current_user.timezone
+
+    for field, value in update_data.items():
         if value is not None:
             setattr(current_user, field, value)
-    
-    db.commit()
-    db.refresh(current_user)
+
+    # Напоминания хранятся в UTC-минутах недели — после смены пояса их нужно пересчитать
+    if timezone_changed:
+        await db.run_sync(reminders.sync_user, current_user)
+
+    await db.commit()
+    await db.refresh(current_user)
     return current_user
 
 
 @router.delete("")
 async def delete_profile(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Удалить профиль пользователя и все связанные данные."""
-    db.delete(current_user)
-    db.commit()
+    friend_ids = await db.run_sync(friends.accepted_friend_ids, current_user.id, False)
+    # дружбы (и их связи) удаляются до пересчёта счётчиков друзей, как в remove_friend:
+    # счётчик, созданный при этом с нуля, не должен учитывать удаляемого пользователя
+    await db.execute(delete(Friendship).where(Friendship.id.in_(
+        select(FriendEdge.friendship_id).where(FriendEdge.user_id == current_user.id)
+    )))
+    await db.run_sync(achievements.on_friendship_removed, friend_ids)
+    await db.run_sync(friends.invalidate, [current_user.id, *friend_ids])
+    # удалённый пользователь был общим другом своих друзей
+    await db.run_sync(suggestions.schedule_friends_regrouped, friend_ids)
+    # участие в чужих совместных привычках удаляется каскадом — их совместные серии пересчитываются
+    # после удаления пользователя, когда его участия и календарей уже нет
+    shared_habit_ids = (await db.execute(select(HabitParticipant.habit_id).join(
+        Habit, Habit.id == HabitParticipant.habit_id
+    ).where(
+        HabitParticipant.user_id == current_user.id,
+        HabitParticipant.status == "accepted",
+        Habit.created_by != current_user.id,
+    ))).scalars().all()
+    await db.delete(current_user)
+    await db.flush()
+    for habit_id in shared_habit_ids:
+        await db.run_sync(streaks.recompute_joint_streak, habit_id)
+    await db.commit()
     return {"message": "Account deleted successfully"}
 
@@ -1,170 +1,269 @@
+import base64
+from collections import defaultdict
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import extract, func, literal_column, select, tuple_
 from uuid import UUID
 from datetime import date, timedelta
-from app.db.database import get_db
+from app.db.database import get_async_db
 from app.core.security import get_current_user
-from app.models import User, Habit, HabitLog, HabitParticipant
-from typing import Dict, Any, Optional
+from app.models import User, Habit, HabitParticipant, HabitDailyRollup, HabitWeeklyRollup
+from app.services import calendar, rollups
+from app.services.streaks import max_consecutive
+from typing import Dict, Any, List, Optional
 
 router = APIRouter()
 
 
+# Детализация ряда статистики: шаг в днях для оценки числа точек
+RESOLUTION_DAYS = {"day": 1, "week": 7, "month": 31}
+# Без явного resolution: дни до квартала, недели до двух лет, дальше — месяцы
+AUTO_DAY_MAX_DAYS = 92
+AUTO_WEEK_MAX_DAYS = 731
+# Верхние границы ответа: окно и число точек на участника
+MAX_STATS_DAYS = 3660
+MAX_STATS_POINTS = 400
+# Привычек в одном запросе /habits?ids=...
+MAX_STATS_HABITS = 50
+
+
+def _pick_resolution(days: int, requested: Optional[str]) -> str:
+    """Детализация ряда: запрошенная (огрубляется, если точек больше MAX_STATS_POINTS) или по окну."""
+    if requested is None:
+        if days <= AUTO_DAY_MAX_DAYS:
+            return "day"
+        return "week" if days <= AUTO_WEEK_MAX_DAYS else "month"
+    if requested not in RESOLUTION_DAYS:
+        raise HTTPException(status_code=400, detail="Invalid resolution (use day, week or month)")
+    order = list(RESOLUTION_DAYS)
+    for resolution in order[order.index(requested):]:
+        if days // RESOLUTION_DAYS[resolution] + 1 <= MAX_STATS_POINTS:
+            return resolution
+    return order[-1]
+
+
+def _schedule(habit: Habit):
+    """Норма привычки: дни недели (1=Пн .. 7=Вс, как во фронте и isodow в PostgreSQL) и цель N из 7."""
+    raw_days = getattr(habit, "days_of_week", None) or []
+    days_of_week = set(int(x) for x in raw_days if x is not None)
+    days_of_week = {d for d in days_of_week if 1 <= d <= 7}
+    return days_of_week, getattr(habit, "weekly_goal_days", None)
+
+
+async def _collect_stats(
+    db: AsyncSession,
+    habits: List[Habit],
+    user_id,
+    days: int,
+    resolution: Optional[str],
+) -> List[Dict[str, Any]]:
+    """
+    Статистика набора привычек (доступ уже проверен) — только по сводкам habit_daily_rollup /
+    habit_weekly_rollup, по одному сгруппированному запросу на метрику: число запросов
+    не зависит ни от числа привычек, ни от окна и объёма логов.
+    """
+    days = max(1, min(days, MAX_STATS_DAYS))
+    resolution = _pick_resolution(days, resolution)
+    start_date = date.today() - timedelta(days=days)
+    habit_ids = [h.id for h in habits]
+
+    accepted_participants = (await db.execute(select(HabitParticipant).where(
+        HabitParticipant.habit_id.in_(habit_ids),
+        HabitParticipant.status == "accepted",
+    ))).scalars().all()
+    participants = {(p.habit_id, p.user_id): p for p in accepted_participants}
+
+    # Отмеченные дни принятых участников (и свои) за период, сгруппированные в SQL
+    # по периодам детализации — один запрос по ключу сводки
+    if resolution == "day":
+        bucket = HabitDailyRollup.day
+    else:
+        # имя периода подставляется литералом: одинаковое выражение в SELECT и GROUP BY
+        bucket = func.date(func.date_trunc(literal_column(f"'{resolution}'"), HabitDailyRollup.day))
+    in_window = (
+        HabitDailyRollup.habit_id.in_(habit_ids),
+        HabitDailyRollup.day >= start_date,
+    )
+    pairs = set(participants) | {(habit_id, user_id) for habit_id in habit_ids}
+    rows = (await db.execute(select(
+        HabitDailyRollup.habit_id,
+        bucket.label("date"),
+        HabitDailyRollup.user_id,
+        func.count().label("count"),
+    ).where(
+        *in_window,
+        tuple_(HabitDailyRollup.habit_id, HabitDailyRollup.user_id).in_(pairs),
+    ).group_by(HabitDailyRollup.habit_id, bucket, HabitDailyRollup.user_id).order_by(bucket))).all()
+
+    daily_completions = defaultdict(list)
+    participant_completions = defaultdict(list)
+    for row in rows:
+        if row.user_id == user_id:
+            daily_completions[row.habit_id].append({"date": str(row.date), "count": row.count})
+        participant = participants.get((row.habit_id, row.user_id))
+        if participant is None:
+            continue
+        participant_completions[row.habit_id].append(
+            {
+                "date": str(row.date),
+                "user_id": row.user_id,
+                "color": getattr(participant, "color", None),
+                "count": row.count,
+            }
+        )
+
+    # Серия — самая длинная серия дней подряд внутри окна; для совместных привычек — по общим
+    # дням всех принятых участников (день, в который отметились все). Не всё время жизни
+    # привычки, как в habit_joint_streaks, а только запрошенный период.
+    accepted_count = defaultdict(int)
+    for habit_id, _ in participants:
+        accepted_count[habit_id] += 1
+    joint_days = defaultdict(list)
+    for row in (await db.execute(select(
+        HabitDailyRollup.habit_id,
+        HabitDailyRollup.day,
+        func.count().label("done"),
+    ).where(
+        *in_window,
+        tuple_(HabitDailyRollup.habit_id, HabitDailyRollup.user_id).in_(set(participants)),
+    ).group_by(HabitDailyRollup.habit_id, HabitDailyRollup.day))).all():
+        if row.done >= accepted_count[row.habit_id]:
+            joint_days[row.habit_id].append(row.day)
+
+    # Сверх нормы: выполнение в день, не входящий в расписание (или сверх цели по неделе).
+    # Режим "N из 7": целые недели периода — из недельной сводки, неполная первая — по дням периода.
+    schedules = {h.id: _schedule(h) for h in habits}
+    goal_ids = [hid for hid, (dow, goal) in schedules.items() if not dow and goal is not None and goal > 0]
+    first_full_week = rollups.week_start(start_date + timedelta(days=6))
+    by_weekday = defaultdict(dict)
+    partial_week = defaultdict(int)
+    if any(dow for dow, _ in schedules.values()) or goal_ids:
+        isodow = extract("isodow", HabitDailyRollup.day)
+        for row in (await db.execute(select(
+            HabitDailyRollup.habit_id,
+            isodow.label("isodow"),
+            func.count().label("count"),
+            func.count().filter(HabitDailyRollup.day < first_full_week).label("partial"),
+        ).where(
+            *in_window,
+            HabitDailyRollup.user_id == user_id,
+        ).group_by(HabitDailyRollup.habit_id, isodow))).all():
+            by_weekday[row.habit_id][int(row.isodow)] = row.count
+            partial_week[row.habit_id] += row.partial
+    weeks_over_goal = defaultdict(list)
+    if goal_ids:
+        for row in (await db.execute(select(
+            HabitWeeklyRollup.habit_id,
+            HabitWeeklyRollup.days_done,
+            func.count().label("weeks"),
+        ).where(
+            HabitWeeklyRollup.habit_id.in_(goal_ids),
+            HabitWeeklyRollup.user_id == user_id,
+            HabitWeeklyRollup.week_start >= first_full_week,
+        ).group_by(HabitWeeklyRollup.habit_id, HabitWeeklyRollup.days_done))).all():
+            weeks_over_goal[row.habit_id].append((row.days_done, row.weeks))
+
+    result = []
+    for habit in habits:
+        days_of_week, weekly_goal_days = schedules[habit.id]
+        above_norm_count = 0
+        if len(days_of_week) > 0:
+            # Режим "конкретные дни": сверх нормы = выполнение в день не из списка
+            above_norm_count = sum(
+                count for weekday, count in by_weekday[habit.id].items() if weekday not in days_of_week
+            )
+        elif habit.id in goal_ids:
+            above_norm_count = sum(
+                max(0, days_done - weekly_goal_days) * weeks for days_done, weeks in weeks_over_goal[habit.id]
+            ) + max(0, partial_week[habit.id] - weekly_goal_days)
+
+        result.append({
+            "habit_id": habit.id,
+            "total_completions": sum(dc["count"] for dc in daily_completions[habit.id]),
+            "current_streak": max_consecutive(joint_days[habit.id]),
+            "above_norm_count": above_norm_count,
+            "daily_completions": daily_completions[habit.id],
+            "participant_completions": participant_completions[habit.id],
+            "period_days": days,
+            "resolution": resolution,
+        })
+    return result
+
+
+@router.get("/habits")
+async def get_habits_stats(
+    ids: Optional[str] = None,
+    days: int = 30,
+    resolution: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Статистика нескольких привычек одним запросом: ids — UUID через запятую,
+    без ids — все привычки пользователя. Элементы ответа — как у /habits/{habit_id}.
+    """
+    my_habit_ids = select(HabitParticipant.habit_id).where(
+        HabitParticipant.user_id == current_user.id,
+        HabitParticipant.status == "accepted",
+    )
+    accessible = (Habit.created_by == current_user.id) | Habit.id.in_(my_habit_ids)
+
+    if ids is None:
+        habits = (await db.execute(select(Habit).where(accessible).order_by(Habit.created_at))).scalars().all()
+    else:
+        try:
+            habit_ids = list(dict.fromkeys(UUID(x.strip()) for x in ids.split(",") if x.strip()))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid habit id")
+        if len(habit_ids) > MAX_STATS_HABITS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_STATS_HABITS} habits per request")
+        # Проверка доступа одним запросом: флаг доступа для каждой запрошенной привычки
+        found = {
+            habit.id: (habit, allowed)
+            for habit, allowed in (await db.execute(
+                select(Habit, accessible).where(Habit.id.in_(habit_ids))
+            )).all()
+        }
+        if len(found) < len(habit_ids):
+            raise HTTPException(status_code=404, detail="Habit not found")
+        if not all(allowed for _, allowed in found.values()):
+            raise HTTPException(status_code=403, detail="Access denied")
+        habits = [found[habit_id][0] for habit_id in habit_ids]
+
+    if not habits:
+        return []
+    return await _collect_stats(db, habits, current_user.id, days, resolution)
+
+
 @router.get("/habits/{habit_id}")
 async def get_habit_stats(
     habit_id: UUID,
     days: int = 30,
+    resolution: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Получить статистику по привычке"""
-    habit = db.query(Habit).filter(Habit.id == habit_id).first()
+    """
+    Получить статистику по привычке.
+
+    resolution — day, week или month; без него выбирается по длине окна. Для week/month
+    daily_completions и participant_completions содержат начало периода и число дней в нём.
+    """
+    habit = await db.get(Habit, habit_id)
     if not habit:
         raise HTTPException(status_code=404, detail="Habit not found")
     
     # Проверка доступа
     if habit.created_by != current_user.id:
-        participant = db.query(HabitParticipant).filter(
+        participant = (await db.execute(select(HabitParticipant).where(
             HabitParticipant.habit_id == habit_id,
             HabitParticipant.user_id == current_user.id,
             HabitParticipant.status == "accepted",
-        ).first()
+        ))).scalars().first()
         if not participant:
             raise HTTPException(status_code=403, detail="Access denied")
-    
-    # Статистика за период
-    start_date = date.today() - timedelta(days=days)
-    
-    # Общее количество выполнений
-    total_completions = db.query(func.count(HabitLog.id)).filter(
-        HabitLog.habit_id == habit_id,
-        HabitLog.user_id == current_user.id,
-        func.date(HabitLog.completed_at) >= start_date
-    ).scalar()
-    
-    # Выполнения по дням
-    daily_completions = db.query(
-        func.date(HabitLog.completed_at).label("date"),
-        func.count(HabitLog.id).label("count")
-    ).filter(
-        HabitLog.habit_id == habit_id,
-        HabitLog.user_id == current_user.id,
-        func.date(HabitLog.completed_at) >= start_date
-    ).group_by(func.date(HabitLog.completed_at)).all()
-    
-    # Максимальная серия дней подряд
-    # Для одиночных привычек считаем по пользователю, для совместных — по общим дням всех участников
-    completion_dates = sorted([dc.date for dc in daily_completions])
-    user_max_streak = 0
-    if completion_dates:
-        current_streak = 1
-        user_max_streak = 1
-        for i in range(1, len(completion_dates)):
-            days_diff = (completion_dates[i] - completion_dates[i - 1]).days
-            if days_diff == 1:
-                current_streak += 1
-                user_max_streak = max(user_max_streak, current_streak)
-            else:
-                current_streak = 1
-
-    accepted_participants = db.query(HabitParticipant).filter(
-        HabitParticipant.habit_id == habit_id,
-        HabitParticipant.status == "accepted",
-    ).all()
-
-    joint_max_streak = user_max_streak
-    participant_completions = []
-
-    if accepted_participants:
-        participant_ids = [p.user_id for p in accepted_participants]
-        participants_by_user = {p.user_id: p for p in accepted_participants}
-
-        rows = db.query(
-            func.date(HabitLog.completed_at).label("date"),
-            HabitLog.user_id,
-        ).filter(
-            HabitLog.habit_id == habit_id,
-            HabitLog.user_id.in_(participant_ids),
-            func.date(HabitLog.completed_at) >= start_date,
-        ).all()
-
-        for row in rows:
-            d = row.date
-            uid = row.user_id
-            participant = participants_by_user.get(uid)
-            participant_completions.append(
-                {
-                    "date": str(d),
-                    "user_id": uid,
-                    "color": getattr(participant, "color", None) if participant else None,
-                }
-            )
 
-        if len(participant_ids) > 1:
-            common_dates = None
-            for uid in participant_ids:
-                user_rows = [
-                    r.date
-                    for r in rows
-                    if r.user_id == uid
-                ]
-                date_set = set(user_rows)
-                if common_dates is None:
-                    common_dates = date_set
-                else:
-                    common_dates &= date_set
-            if common_dates:
-                ordered = sorted(common_dates)
-                cur = 1
-                joint_max_streak = 1
-                for i in range(1, len(ordered)):
-                    if (ordered[i] - ordered[i - 1]).days == 1:
-                        cur += 1
-                        if cur > joint_max_streak:
-                            joint_max_streak = cur
-                    else:
-                        cur = 1
-
-    current_streak = joint_max_streak
-
-    # Сверх нормы: выполнение в день, не входящий в расписание (или сверх цели по неделе)
-    # Единая нумерация: 1=Пн, 2=Вт, ..., 7=Вс (как во фронте)
-    above_norm_count = 0
-    raw_days = getattr(habit, "days_of_week", None) or []
-    days_of_week = set(int(x) for x in raw_days if x is not None)
-    days_of_week = {d for d in days_of_week if 1 <= d <= 7}
-    weekly_goal_days = getattr(habit, "weekly_goal_days", None)
-
-    if len(days_of_week) > 0:
-        # Режим "конкретные дни": сверх нормы = выполнение в день не из списка (1=Пн .. 7=Вс)
-        for dc in daily_completions:
-            d = dc.date
-            weekday_iso = d.weekday() + 1  # Python date.weekday(): 0=Mon, 6=Sun -> 1..7
-            if weekday_iso not in days_of_week:
-                above_norm_count += dc.count
-    elif weekly_goal_days is not None and weekly_goal_days > 0:
-        # Режим "N из 7": на каждой неделе считаем лишние выполнения сверх N
-        week_completions = {}
-        for dc in daily_completions:
-            d = dc.date
-            wstart = d - timedelta(days=d.weekday())
-            key = str(wstart)
-            week_completions[key] = week_completions.get(key, 0) + dc.count
-        for count in week_completions.values():
-            above_norm_count += max(0, count - weekly_goal_days)
-
-    return {
-        "habit_id": habit_id,
-        "total_completions": total_completions or 0,
-        "current_streak": current_streak,
-        "above_norm_count": above_norm_count,
-        "daily_completions": [
-            {"date": str(dc.date), "count": dc.count} for dc in daily_completions
-        ],
-        "participant_completions": participant_completions,
-        "period_days": days
-    }
+    return (await _collect_stats(db, [habit], current_user.id, days, resolution))[0]
 
 
 @router.get("/yearly")
@@ -172,7 +271,7 @@ async def get_yearly_report(
     year: int,
     habit_id: Optional[UUID] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ) -> Dict[str, Any]:
     """Годовой отчёт по привычкам пользователя.
 
@@ -181,45 +280,50 @@ async def get_yearly_report(
     year_int = int(year)
 
     # Все года, в которых у пользователя есть выполнения любых привычек
-    year_rows = (
-        db.query(func.extract("year", HabitLog.completed_at).label("y"))
-        .filter(HabitLog.user_id == current_user.id)
-        .group_by("y")
-        .order_by("y")
-        .all()
-    )
-    years = [int(row.y) for row in year_rows]
+    years = await db.run_sync(calendar.user_years, current_user.id)
 
     completed_dates: list[str] = []
 
     if habit_id is not None:
-        habit = db.query(Habit).filter(Habit.id == habit_id).first()
+        habit = await db.get(Habit, habit_id)
         if not habit:
             raise HTTPException(status_code=404, detail="Habit not found")
 
         # Проверка доступа
         if habit.created_by != current_user.id:
-            participant = db.query(HabitParticipant).filter(
+            participant = (await db.execute(select(HabitParticipant).where(
                 HabitParticipant.habit_id == habit_id,
                 HabitParticipant.user_id == current_user.id,
                 HabitParticipant.status == "accepted",
-            ).first()
+            ))).scalars().first()
             if not participant:
                 raise HTTPException(status_code=403, detail="Access denied")
 
-        rows = (
-            db.query(func.date(HabitLog.completed_at).label("d"))
-            .filter(
-                HabitLog.habit_id == habit_id,
-                HabitLog.user_id == current_user.id,
-                func.extract("year", HabitLog.completed_at) == year_int,
-            )
-            .order_by("d")
-            .all()
-        )
-        completed_dates = [str(r.d) for r in rows]
+        days_done = await db.run_sync(calendar.user_days, habit_id, current_user.id, year_int)
+        completed_dates = [str(d) for d in days_done]
 
     return {
         "years": years,
         "completed_dates": completed_dates,
     }
+
+
+@router.get("/yearly/heatmap")
+async def get_yearly_heatmap(
+    year: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+) -> Dict[str, Any]:
+    """Годовая тепловая карта всех привычек пользователя.
+
+    habits — {habit_id: календарь года в base64}: 46 байт, бит n (байт n // 8, n % 8-й младший бит)
+    отмечает день n от 1 января. Привычки без отметок за год не возвращаются.
+    Годы и календари читаются из habit_calendars по индексу (user_id, year) без обращения к таблице.
+    """
+    years = await db.run_sync(calendar.user_years, current_user.id)
+    bits = await db.run_sync(calendar.user_year_bits, current_user.id, int(year))
+    return {
+        "year": int(year),
+        "years": years,
+        "habits": {str(habit_id): base64.b64encode(value).decode("ascii") for habit_id, value in bits.items()},
+    }
@@ -17,6 +17,39 @@ class Settings(BaseSettings):
     
     # Security
     SECRET_KEY: str = "your-secret-key-change-in-production"
+    TELEGRAM_AUTH_MAX_AGE: int = 86400  # сколько секунд initData (auth_date) считается действительным
+    AUTH_CACHE_SIZE: int = 10000  # проверенных initData в кэше процесса
+    AUTH_CACHE_TTL: int = 300  # секунды жизни записи hash initData -> user_id
+    FRIENDS_CACHE_SIZE: int = 50000  # пользователей в кэше списков друзей процесса
+    FRIENDS_CACHE_TTL: int = 60  # секунды; ограничивает устаревание между процессами
+
+    # Пул асинхронных подключений API (asyncpg) — на процесс uvicorn
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0  # секунды ожидания свободного подключения
+    DB_POOL_RECYCLE: int = 1800  # пересоздавать подключения старше N секунд
+
+    # Пулы асинхронных подключений процессов бота (asyncpg)
+    WORKER_DB_POOL_SIZE: int = 10  # воркер уведомлений: захватчики ленты + напоминания
+    WORKER_DB_MAX_OVERFLOW: int = 10
+    BOT_DB_POOL_SIZE: int = 5  # telegram_bot: короткие запросы в /start
+    BOT_DB_MAX_OVERFLOW: int = 5
+
+    # Background jobs (побочные эффекты после записи: лента, достижения)
+    JOB_WORKERS: int = 4
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_POLL_INTERVAL: float = 5.0  # секунды между опросами таблицы, если нет сигналов
+    JOB_LEASE_SECONDS: int = 300  # через сколько зависшая задача снова доступна
+
+    # Telegram sender (воркер уведомлений)
+    TELEGRAM_SEND_CONCURRENCY: int = 20  # одновременных запросов к Bot API
+    TELEGRAM_GLOBAL_RATE: float = 25.0  # сообщений в секунду на бота (лимит Telegram ~30)
+    TELEGRAM_CHAT_RATE: float = 1.0  # сообщений в секунду в один чат
+    TELEGRAM_SEND_ATTEMPTS: int = 4
+    FEED_NOTIFY_BATCH_SIZE: int = 100  # событий ленты, захватываемых за одну транзакцию
+    FEED_NOTIFY_WORKERS: int = 2  # параллельных захватчиков в одном процессе воркера
+    FEED_NOTIFY_MAX_BATCHES: int = 10  # пачек на захватчика за тик; остаток ждёт следующей минуты
+    REMINDER_CATCHUP_MINUTES: int = 60  # сколько пропущенных минут напоминаний досылать после простоя
     
     class Config:
         env_file = ".env"
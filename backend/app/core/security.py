@@ -2,87 +2,166 @@ from fastapi import HTTPException, Header, Depends
 from typing import Optional
 import hmac
 import hashlib
+import json
+import time
+import urllib.parse
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.db.database import get_db, SessionLocal
-from app.models import User, Friendship
-from sqlalchemy.orm import Session
+from app.db.database import get_async_db
+from app.models import User, Friendship, FriendEdge
+from app.services import achievements, friends, suggestions
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Секретный ключ проверки initData: HMAC_SHA256(key="WebAppData", msg=bot_token), считается один раз
+WEBAPP_SECRET = hmac.new(b"WebAppData", settings.TELEGRAM_BOT_TOKEN.encode(), hashlib.sha256).digest()
+
+# sha256 всей строки проверенного initData -> users.id: повторные запросы сессии Mini App
+# не перепроверяют подпись, а попадание в кэш требует тех же байтов, что были проверены
+_verified_users = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_TTL)
+# (users.id, start_param), для которых реферальная дружба уже обработана
+_processed_referrals = TTLCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.TELEGRAM_AUTH_MAX_AGE)
+
+
+def sign_init_data(fields: dict) -> str:
+    """Подписать поля initData секретом бота (как это делает Telegram) — для тестов и нагрузочных скриптов."""
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    signature = hmac.new(WEBAPP_SECRET, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urllib.parse.urlencode({**fields, "hash": signature})
 
 
 def verify_telegram_auth(init_data: str) -> dict:
     """
-    Верификация данных от Telegram Web App
-    В продакшене нужно использовать правильную валидацию через Telegram
+    Верификация данных от Telegram Web App.
+
+    Подпись — HMAC_SHA256(WEBAPP_SECRET, data_check_string), где data_check_string —
+    отсортированные пары key=value без hash, разделённые переводом строки.
+    auth_date старше TELEGRAM_AUTH_MAX_AGE отклоняется.
     """
-    # Упрощенная версия для разработки
-    # В продакшене нужно использовать правильную валидацию
-    # Для разработки можно парсить init_data вручную
     try:
-        # Парсинг init_data (упрощенная версия)
-        # В реальности нужно проверять подпись через секретный ключ бота
-        import urllib.parse
-        params = urllib.parse.parse_qs(init_data)
-        user_str = params.get('user', ['{}'])[0]
-        import json
-        user_data = json.loads(user_str)
-        start_param = params.get('start_param', [None])[0]
-        return {
-            "id": user_data.get("id", 123456789),
-            "first_name": user_data.get("first_name", "Test"),
-            "username": user_data.get("username", "testuser"),
-            "last_name": user_data.get("last_name"),
-            "start_param": start_param,
-        }
-    except:
-        # Fallback для разработки
-        return {"id": 123456789, "first_name": "Test", "username": "testuser", "start_param": None}
-
-
-def get_current_user(
+        # пустые значения тоже входят в data_check_string, без keep_blank_values подпись не сойдётся
+        params = dict(urllib.parse.parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid telegram data")
+    received_hash = params.pop("hash", None)
+    if not received_hash:
+        raise HTTPException(status_code=401, detail="Invalid telegram data")
+
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(params.items()))
+    expected_hash = hmac.new(WEBAPP_SECRET, data_check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected_hash, received_hash):
+        raise HTTPException(status_code=401, detail="Invalid telegram data")
+
+    try:
+        auth_date = int(params.get("auth_date", 0))
+        user_data = json.loads(params.get("user", "{}"))
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid telegram data")
+    expires_in = auth_date + settings.TELEGRAM_AUTH_MAX_AGE - time.time()
+    if expires_in <= 0:
+        raise HTTPException(status_code=401, detail="Telegram data expired")
+
+    return {
+        "id": user_data.get("id"),
+        "first_name": user_data.get("first_name"),
+        "username": user_data.get("username"),
+        "last_name": user_data.get("last_name"),
+        "start_param": params.get("start_param"),
+        "expires_in": expires_in,
+    }
+
+
+def _init_data_key(init_data: str) -> str:
+    """Ключ кэша проверенных сессий: дайджест initData целиком, а не присланное поле hash."""
+    return hashlib.sha256(init_data.encode()).hexdigest()
+
+
+async def get_current_user(
     x_telegram_init_data: Optional[str] = Header(None, alias="X-Telegram-Init-Data"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """
     Получение текущего пользователя из Telegram данных
     """
     if not x_telegram_init_data:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    
+
+    # Повторный запрос с уже проверенным initData — только выборка по первичному ключу
+    init_key = _init_data_key(x_telegram_init_data)
+    cached_user_id = _verified_users.get(init_key)
+    if cached_user_id is not None:
+        user = await db.get(User, cached_user_id)
+        if user is not None:
+            return user
+        _verified_users.pop(init_key)
+
     # Верификация данных Telegram
     telegram_data = verify_telegram_auth(x_telegram_init_data)
     telegram_id = telegram_data.get("id")
     start_param = telegram_data.get("start_param")
-    
+
     if not telegram_id:
         raise HTTPException(status_code=401, detail="Invalid telegram data")
-    
-    # Поиск или создание пользователя
-    user = db.query(User).filter(User.telegram_id == telegram_id).first()
-    
-    if not user:
-        user = User(
-            telegram_id=telegram_id,
-            username=telegram_data.get("username"),
-            first_name=telegram_data.get("first_name"),
-            last_name=telegram_data.get("last_name")
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-
-    # Автопринятие инвайта по реф-коду (start_param)
-    if start_param:
-        inviter = db.query(User).filter(User.referral_code == start_param).first()
+
+    # Поиск или создание пользователя одним INSERT ... ON CONFLICT (telegram_id) DO UPDATE ... RETURNING:
+    # параллельные первые запросы Mini App не упираются в уникальность telegram_id.
+    # Имена, изменённые в профиле, не перезаписываются — заполняются только пустые.
+    stmt = pg_insert(User).values(
+        telegram_id=telegram_id,
+        username=telegram_data.get("username"),
+        first_name=telegram_data.get("first_name"),
+        last_name=telegram_data.get("last_name"),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={
+            "username": func.coalesce(User.username, stmt.excluded.username),
+            "first_name": func.coalesce(User.first_name, stmt.excluded.first_name),
+            "last_name": func.coalesce(User.last_name, stmt.excluded.last_name),
+        },
+    ).returning(User)
+    user = (await db.scalars(stmt, execution_options={"populate_existing": True})).one()
+    await db.commit()
+
+    # Автопринятие инвайта по реф-коду (start_param) — один раз на пару (пользователь, start_param)
+    if start_param and (user.id, start_param) not in _processed_referrals:
+        inviter = (await db.execute(select(User).where(User.referral_code == start_param))).scalars().first()
         if inviter and inviter.id != user.id:
-            existing = db.query(Friendship).filter(
-                ((Friendship.user_id == inviter.id) & (Friendship.friend_id == user.id)) |
-                ((Friendship.user_id == user.id) & (Friendship.friend_id == inviter.id))
-            ).first()
-            if not existing:
-                friendship = Friendship(user_id=inviter.id, friend_id=user.id, status="accepted")
-                db.add(friendship)
-                db.commit()
-            elif existing.status != "accepted":
-                existing.status = "accepted"
-                db.commit()
+            # Связь (user -> inviter) покрывает дружбу в любом направлении
+            friendship_id = await db.scalar(select(FriendEdge.friendship_id).where(
+                FriendEdge.user_id == user.id,
+                FriendEdge.friend_id == inviter.id,
+            ))
+            # Запись возвращается только при вставке или переводе в accepted, поэтому при гонке
+            # параллельных запросов счётчики друзей растут ровно один раз
+            if friendship_id is not None:
+                accepted = (await db.execute(
+                    update(Friendship)
+                    .where(Friendship.id == friendship_id, Friendship.status != "accepted")
+                    .values(status="accepted")
+                    .returning(Friendship)
+                )).scalars().first()
+            else:
+                # Upsert по unique_friendship
+                accepted = (await db.scalars(
+                    pg_insert(Friendship)
+                    .values(user_id=inviter.id, friend_id=user.id, status="accepted")
+                    .on_conflict_do_update(
+                        constraint="unique_friendship",
+                        set_={"status": "accepted", "updated_at": func.now()},
+                        where=Friendship.status != "accepted",
+                    )
+                    .returning(Friendship),
+                    execution_options={"populate_existing": True},
+                )).first()
+            if accepted is not None:
+                await db.run_sync(friends.save_edges, accepted)
+                await db.run_sync(achievements.on_friendship_accepted, [inviter.id, user.id])
+                await db.run_sync(friends.invalidate, [inviter.id, user.id])
+                await db.run_sync(suggestions.schedule_friendship_changed, inviter.id, user.id)
+            await db.commit()
+        _processed_referrals.set((user.id, start_param), True)
 
+    _verified_users.set(init_key, user.id, ttl=min(settings.AUTH_CACHE_TTL, telegram_data["expires_in"]))
     return user
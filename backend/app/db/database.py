@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -17,3 +19,38 @@ def get_db():
     finally:
         db.close()
 
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL с драйвером asyncpg (postgresql:// и postgresql+psycopg2:// -> postgresql+asyncpg://)."""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+def create_async_session_factory(pool_size: int = 5, max_overflow: int = 10, **engine_kwargs) -> async_sessionmaker:
+    """
+    Отдельный асинхронный движок со своим пулом (для воркеров и бота, работающих в asyncio).
+    Объекты не истекают после commit: в async-коде ленивые загрузки недоступны.
+    """
+    async_engine = create_async_engine(
+        async_database_url(settings.DATABASE_URL),
+        pool_pre_ping=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        **engine_kwargs,
+    )
+    return async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+# Асинхронные сессии API: запросы роутеров не блокируют цикл событий uvicorn
+AsyncSessionLocal = create_async_session_factory(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+)
+
+
+async def get_async_db():
+    """Dependency для получения асинхронной сессии БД"""
+    async with AsyncSessionLocal() as db:
+        yield db
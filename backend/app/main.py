@@ -3,8 +3,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api import auth, habits, friends, stats, profile, feed, achievements
 from app.db.database import engine, Base
+from app.services.jobs import runner
 # Импортируем модели, чтобы они зарегистрировались в Base.metadata
-from app.models import User, Habit, HabitParticipant, HabitLog, HabitNotification, Friendship, UserAchievement
+from app.models import User, Habit, HabitParticipant, HabitLog, HabitCalendar, HabitDailyRollup, HabitWeeklyRollup, HabitNotification, Friendship, FriendEdge, FriendSuggestion, UserAchievement, UserCounter, HabitStreak, HabitJointStreak, BackgroundJob, ReminderSlot, SchedulerCursor
 
 # Создание таблиц
 Base.metadata.create_all(bind=engine)
@@ -24,6 +25,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.on_event("startup")
+async def start_background_jobs():
+    # Пул воркеров фоновых задач (лента, достижения) в том же процессе
+    runner.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    await runner.stop()
+
+
 # Подключение роутеров
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(habits.router, prefix="/api/habits", tags=["habits"])
@@ -1,16 +1,31 @@
 from app.models.user import User
-from app.models.habit import Habit, HabitParticipant, HabitLog, HabitNotification, FeedEvent
-from app.models.friendship import Friendship
-from app.models.achievement import UserAchievement
+from app.models.habit import Habit, HabitParticipant, HabitLog, HabitCalendar, HabitDailyRollup, HabitWeeklyRollup, HabitNotification, FeedEvent
+from app.models.friendship import Friendship, FriendEdge, FriendSuggestion
+from app.models.achievement import UserAchievement, UserCounter
+from app.models.streak import HabitStreak, HabitJointStreak
+from app.models.job import BackgroundJob
+from app.models.reminder import ReminderSlot
+from app.models.scheduler import SchedulerCursor
 
 __all__ = [
     "User",
     "Habit",
     "HabitParticipant",
     "HabitLog",
+    "HabitCalendar",
+    "HabitDailyRollup",
+    "HabitWeeklyRollup",
     "HabitNotification",
     "FeedEvent",
     "Friendship",
+    "FriendEdge",
+    "FriendSuggestion",
     "UserAchievement",
+    "UserCounter",
+    "HabitStreak",
+    "HabitJointStreak",
+    "BackgroundJob",
+    "ReminderSlot",
+    "SchedulerCursor",
 ]
 
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, DateTime, String, Integer, ForeignKey, JSON
+from sqlalchemy import Column, DateTime, String, Integer, ForeignKey, JSON, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from app.db.database import Base
@@ -14,3 +14,20 @@ class UserAchievement(Base):
     tier = Column(Integer, nullable=False)  # e.g., 1,2,3 (progressive thresholds)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     metadata_ = Column(JSON, nullable=True)  # extra info, e.g., habit_id, threshold
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "type", "tier", name="unique_user_achievement"),
+    )
+
+
+class UserCounter(Base):
+    """Счётчики пользователя для правил достижений, обновляются инкрементально."""
+    __tablename__ = "user_counters"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, unique=True)
+    total_days = Column(Integer, default=0, nullable=False)  # дни, в которые выполнена хоть одна привычка
+    friends_count = Column(Integer, default=0, nullable=False)  # принятые дружбы
+    best_streak = Column(Integer, default=0, nullable=False)  # лучшая серия по одной привычке
+    best_habit_participants = Column(Integer, default=0, nullable=False)  # макс. принятых участников в своей привычке
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
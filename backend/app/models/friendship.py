@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime, CheckConstraint, UniqueConstraint
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, CheckConstraint, UniqueConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -25,3 +25,40 @@ class Friendship(Base):
         CheckConstraint("user_id != friend_id", name="check_self_friendship"),
     )
 
+
+
+class FriendEdge(Base):
+    """
+    Направленная связь дружбы: по строке на каждую сторону (user -> friend), статус как у friendships.
+    Списки и счётчики друзей читаются индексом (user_id, status, friend_id) без OR по двум колонкам.
+    """
+    __tablename__ = "friend_edges"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    friend_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # удаление дружбы удаляет обе связи в той же транзакции
+    friendship_id = Column(UUID(as_uuid=True), ForeignKey("friendships.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(20), nullable=False)
+
+    __table_args__ = (
+        Index("idx_friend_edges_user_status_friend", "user_id", "status", "friend_id"),
+    )
+
+
+class FriendSuggestion(Base):
+    """
+    Кандидат в друзья: общие друзья и общие привычки с пользователем.
+    Пересчитывается по затронутым парам при изменении дружб (app/services/suggestions.py).
+    """
+    __tablename__ = "friend_suggestions"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    candidate_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    mutual_friends = Column(Integer, default=0, nullable=False)
+    shared_habits = Column(Integer, default=0, nullable=False)
+    score = Column(Integer, default=0, nullable=False)  # mutual_friends + shared_habits
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("idx_friend_suggestions_user_score", "user_id", "score"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, Boolean, ForeignKey, DateTime, Time, ARRAY, Integer
+from sqlalchemy import Column, String, Text, Boolean, ForeignKey, DateTime, Date, Computed, Time, ARRAY, Integer, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -54,12 +54,57 @@ class HabitLog(Base):
     habit_id = Column(UUID(as_uuid=True), ForeignKey("habits.id", ondelete="CASCADE"), nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     completed_at = Column(DateTime(timezone=True), server_default=func.now())
+    # День отметки (UTC), хранимая генерируемая колонка: фильтры по дню идут по обычным индексам
+    completed_date = Column(Date, Computed("CAST(completed_at AT TIME ZONE 'UTC' AS DATE)", persisted=True))
     notes = Column(Text)
 
     # Relationships
     habit = relationship("Habit", back_populates="logs")
     user = relationship("User")
 
+    __table_args__ = (
+        # одна отметка в день; INSERT ... ON CONFLICT DO NOTHING при отметке
+        Index("idx_habit_logs_habit_user_date", "habit_id", "user_id", "completed_date", unique=True),
+        # дни пользователя по всем привычкам (счётчик total_days)
+        Index("idx_habit_logs_user_date", "user_id", "completed_date"),
+    )
+
+
+class HabitCalendar(Base):
+    """Календарь выполнений участника за год: один бит на день (бит 0 = 1 января), 46 байт."""
+    __tablename__ = "habit_calendars"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    habit_id = Column(UUID(as_uuid=True), ForeignKey("habits.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    year = Column(Integer, nullable=False)
+    bits = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("habit_id", "user_id", "year", name="unique_habit_calendar"),
+        # годы и годовые календари пользователя по всем привычкам — index-only scan
+        Index("idx_habit_calendars_user_year", "user_id", "year", postgresql_include=["habit_id", "bits"]),
+    )
+
+
+class HabitDailyRollup(Base):
+    """Дневная сводка выполнений: строка на (привычка, участник, день) с отметкой."""
+    __tablename__ = "habit_daily_rollup"
+
+    habit_id = Column(UUID(as_uuid=True), ForeignKey("habits.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+
+class HabitWeeklyRollup(Base):
+    """Недельная сводка: число отмеченных дней участника за неделю (week_start — понедельник)."""
+    __tablename__ = "habit_weekly_rollup"
+
+    habit_id = Column(UUID(as_uuid=True), ForeignKey("habits.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    week_start = Column(Date, primary_key=True)
+    days_done = Column(Integer, default=0, nullable=False)
+
 
 class HabitNotification(Base):
     __tablename__ = "habit_notifications"
@@ -88,13 +133,27 @@ class FeedEvent(Base):
     actor_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"))
     # Какому объекту привычки относится событие (может быть NULL для общих событий)
     habit_id = Column(UUID(as_uuid=True), ForeignKey("habits.id", ondelete="SET NULL"))
-    # Тип события: invited | joined | declined | left | completed
+    # Тип события: invited | joined | declined | left | completed | achievement
     event_type = Column(String(32), nullable=False)
+    # Для событий achievement — какое именно достижение получено
+    achievement_id = Column(UUID(as_uuid=True), ForeignKey("user_achievements.id", ondelete="SET NULL"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # День события (UTC) для очистки старых событий по диапазону
+    created_date = Column(Date, Computed("CAST(created_at AT TIME ZONE 'UTC' AS DATE)", persisted=True))
     notification_sent = Column(Boolean, default=False, nullable=False)
 
     # Relationships
     user = relationship("User", foreign_keys=[user_id])
     actor = relationship("User", foreign_keys=[actor_id])
     habit = relationship("Habit")
+    achievement = relationship("UserAchievement")
+
+    __table_args__ = (
+        # keyset-пагинация ленты: WHERE user_id = ? AND (created_at, id) < (?, ?)
+        Index("idx_feed_events_user_created_id", "user_id", "created_at", "id"),
+        # захват неотправленных уведомлений воркером (FOR UPDATE SKIP LOCKED)
+        Index("idx_feed_events_unsent", "created_at", postgresql_where=(notification_sent == False)),
+        # очистка старых событий: WHERE created_date < ?
+        Index("idx_feed_events_created_date", "created_date"),
+    )
 
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, String, Text, Integer, DateTime, JSON, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+import uuid
+from app.db.database import Base
+
+
+class BackgroundJob(Base):
+    """Отложенная побочная задача (лента, достижения), выполняется пулом воркеров в процессе API."""
+    __tablename__ = "background_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind = Column(String(64), nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(16), nullable=False, default="pending")  # pending | running | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    # когда задачу можно брать: время ретрая для pending, конец аренды для running
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("idx_background_jobs_status_run_after", "status", "run_after"),
+    )
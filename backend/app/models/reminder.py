@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from app.db.database import Base
+
+
+class ReminderSlot(Base):
+    """Минута недели (UTC), в которую участнику нужно напомнить о привычке."""
+    __tablename__ = "reminder_slots"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    participant_id = Column(UUID(as_uuid=True), ForeignKey("habit_participants.id", ondelete="CASCADE"), nullable=False)
+    habit_id = Column(UUID(as_uuid=True), ForeignKey("habits.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # 0 = понедельник 00:00 UTC, 10079 = воскресенье 23:59 UTC
+    minute_of_week = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("participant_id", "minute_of_week", name="unique_reminder_slot"),
+        Index("idx_reminder_slots_minute", "minute_of_week"),
+    )
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+from app.db.database import Base
+
+
+class SchedulerCursor(Base):
+    """Последняя обработанная минута периодической задачи воркера (например, напоминаний)."""
+    __tablename__ = "scheduler_cursors"
+
+    name = Column(String(64), primary_key=True)
+    last_minute = Column(DateTime(timezone=True), nullable=False)  # начало минуты, UTC
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
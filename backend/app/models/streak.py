@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+import uuid
+from app.db.database import Base
+
+
+class HabitStreak(Base):
+    """Серия участника по привычке, поддерживается инкрементально при отметках."""
+    __tablename__ = "habit_streaks"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    habit_id = Column(UUID(as_uuid=True), ForeignKey("habits.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    current_streak = Column(Integer, default=0, nullable=False)  # серия, заканчивающаяся в last_date
+    max_streak = Column(Integer, default=0, nullable=False)
+    last_date = Column(Date)  # последний день с отметкой
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("habit_id", "user_id", name="unique_habit_streak"),
+    )
+
+
+class HabitJointStreak(Base):
+    """Совместная серия привычки: дни, в которые отметились все принятые участники."""
+    __tablename__ = "habit_joint_streaks"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    habit_id = Column(UUID(as_uuid=True), ForeignKey("habits.id", ondelete="CASCADE"), nullable=False, unique=True)
+    current_streak = Column(Integer, default=0, nullable=False)
+    max_streak = Column(Integer, default=0, nullable=False)
+    last_date = Column(Date)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
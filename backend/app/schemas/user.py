@@ -11,6 +11,7 @@ class UserBase(BaseModel):
     avatar_emoji: str = "👤"
     bio: Optional[str] = None
     first_day_of_week: Optional[str] = "monday"  # monday | sunday
+    timezone: str = "Europe/Moscow"  # IANA, например Asia/Yekaterinburg
     habit_reminders_enabled: bool = True
     feed_notifications_enabled: bool = True
 
@@ -26,6 +27,7 @@ class UserUpdate(BaseModel):
     avatar_emoji: Optional[str] = None
     bio: Optional[str] = None
     first_day_of_week: Optional[str] = None
+    timezone: Optional[str] = None
     habit_reminders_enabled: Optional[bool] = None
     feed_notifications_enabled: Optional[bool] = None
 
@@ -0,0 +1,215 @@
+from datetime import date
+from typing import Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models import Habit, HabitParticipant, HabitLog, HabitStreak, FeedEvent, FriendEdge, UserAchievement, UserCounter
+from app.services import friends, jobs
+
+# Декларативные правила: тип достижения -> счётчик в user_counters и пороги по уровням.
+# habit_scoped: событие в ленте и metadata_ привязываются к привычке, вызвавшей достижение.
+ACHIEVEMENT_RULES = {
+    "total_days": {"counter": "total_days", "tiers": [(1, 7), (2, 14), (3, 21)], "habit_scoped": False},
+    "streak": {"counter": "best_streak", "tiers": [(1, 5), (2, 15), (3, 30)], "habit_scoped": True},
+    "friends_count": {"counter": "friends_count", "tiers": [(1, 3), (2, 7), (3, 10)], "habit_scoped": False},
+    "habit_invites": {"counter": "best_habit_participants", "tiers": [(1, 1), (2, 3), (3, 5)], "habit_scoped": True},
+}
+
+
+def _count_total_days(db: Session, user_id) -> int:
+    return db.query(func.count(func.distinct(HabitLog.completed_date))).filter(
+        HabitLog.user_id == user_id
+    ).scalar() or 0
+
+
+def _count_friends(db: Session, user_id) -> int:
+    return db.query(func.count()).select_from(FriendEdge).filter(
+        FriendEdge.user_id == user_id,
+        FriendEdge.status == "accepted",
+    ).scalar() or 0
+
+
+def _best_streak(db: Session, user_id) -> int:
+    return db.query(func.max(HabitStreak.max_streak)).filter(HabitStreak.user_id == user_id).scalar() or 0
+
+
+def _best_habit_participants(db: Session, user_id) -> int:
+    counts = db.query(func.count(HabitParticipant.id).label("n")).join(
+        Habit, Habit.id == HabitParticipant.habit_id
+    ).filter(
+        Habit.created_by == user_id,
+        HabitParticipant.status == "accepted",
+    ).group_by(HabitParticipant.habit_id).subquery()
+    return db.query(func.max(counts.c.n)).scalar() or 0
+
+
+def _load_counters(db: Session, user_id) -> Tuple[UserCounter, bool]:
+    """
+    Счётчики пользователя под блокировкой строки.
+
+    Если строки ещё нет, она заполняется по текущему состоянию БД (включая изменения
+    текущей транзакции); тогда второй элемент — True и дельту применять не нужно.
+    """
+    db.flush()
+    counters = db.query(UserCounter).filter(UserCounter.user_id == user_id).with_for_update().first()
+    if counters is not None:
+        return counters, False
+
+    created = db.execute(
+        pg_insert(UserCounter)
+        .values(
+            user_id=user_id,
+            total_days=_count_total_days(db, user_id),
+            friends_count=_count_friends(db, user_id),
+            best_streak=_best_streak(db, user_id),
+            best_habit_participants=_best_habit_participants(db, user_id),
+        )
+        .on_conflict_do_nothing(index_elements=[UserCounter.user_id])
+        .returning(UserCounter.id)
+    ).first()
+    counters = db.query(UserCounter).filter(UserCounter.user_id == user_id).with_for_update().populate_existing().one()
+    return counters, created is not None
+
+
+def evaluate(
+    db: Session,
+    counters: UserCounter,
+    types: Iterable[str],
+    habit_id=None,
+    friend_ids: Optional[set] = None,
+) -> List[UserAchievement]:
+    """
+    Проверить правила указанных типов по счётчикам и выдать новые уровни.
+
+    Все новые уровни вставляются одним INSERT, после чего расходятся по ленте друзей.
+    """
+    types = list(types)
+    candidates = []
+    for type_ in types:
+        rule = ACHIEVEMENT_RULES[type_]
+        value = getattr(counters, rule["counter"]) or 0
+        for tier, threshold in rule["tiers"]:
+            if value >= threshold:
+                candidates.append((type_, tier, threshold))
+    if not candidates:
+        return []
+
+    unlocked = set(
+        db.query(UserAchievement.type, UserAchievement.tier).filter(
+            UserAchievement.user_id == counters.user_id,
+            UserAchievement.type.in_(types),
+        ).all()
+    )
+    rows = []
+    for type_, tier, threshold in candidates:
+        if (type_, tier) in unlocked:
+            continue
+        metadata = {"threshold": threshold}
+        if ACHIEVEMENT_RULES[type_]["habit_scoped"] and habit_id is not None:
+            metadata["habit_id"] = str(habit_id)
+        rows.append({"user_id": counters.user_id, "type": type_, "tier": tier, "metadata_": metadata})
+    if not rows:
+        return []
+
+    granted = db.scalars(
+        pg_insert(UserAchievement).values(rows).on_conflict_do_nothing().returning(UserAchievement)
+    ).all()
+    if granted:
+        _fan_out(db, counters.user_id, granted, habit_id, friend_ids)
+    return granted
+
+
+def _fan_out(db: Session, user_id, granted: List[UserAchievement], habit_id, friend_ids: Optional[set]) -> None:
+    """События achievement для самого пользователя и всех его друзей — одной пачкой."""
+    if friend_ids is None:
+        friend_ids = friends.accepted_friend_ids(db, user_id)
+    events = []
+    for achievement in granted:
+        event_habit_id = habit_id if ACHIEVEMENT_RULES[achievement.type]["habit_scoped"] else None
+        for recipient_id in list(friend_ids) + [user_id]:
+            events.append({
+                "user_id": recipient_id,
+                "actor_id": user_id,
+                "habit_id": event_habit_id,
+                "event_type": "achievement",
+                "achievement_id": achievement.id,
+            })
+    db.execute(insert(FeedEvent), events)
+
+
+def schedule_evaluation(db: Session, user_id, types: Iterable[str], habit_id=None) -> None:
+    """Отложить проверку правил и рассылку по ленте друзей в фоновую задачу."""
+    jobs.enqueue(db, "achievements.evaluate", {
+        "user_id": str(user_id),
+        "types": list(types),
+        "habit_id": str(habit_id) if habit_id is not None else None,
+    })
+
+
+@jobs.handler("achievements.evaluate")
+def _evaluate_job(db: Session, payload: dict) -> None:
+    counters, _ = _load_counters(db, UUID(payload["user_id"]))
+    habit_id = UUID(payload["habit_id"]) if payload.get("habit_id") else None
+    evaluate(db, counters, payload["types"], habit_id=habit_id)
+
+
+def on_completion(db: Session, user_id, day: date, streak: int, habit_id) -> None:
+    """Новая отметка (уже вставлена): total_days и лучшая серия; проверка правил — в фоне."""
+    counters, fresh = _load_counters(db, user_id)
+    if not fresh:
+        logs_that_day = db.query(func.count(HabitLog.id)).filter(
+            HabitLog.user_id == user_id,
+            HabitLog.completed_date == day,
+        ).scalar() or 0
+        if logs_that_day == 1:
+            counters.total_days += 1
+    counters.best_streak = max(counters.best_streak or 0, streak)
+    schedule_evaluation(db, user_id, ["total_days", "streak"], habit_id=habit_id)
+
+
+def on_log_removed(db: Session, user_id, day: date) -> None:
+    """Отметка удалена (уже удалена в сессии): день выпадает, если других отметок за него нет."""
+    counters, fresh = _load_counters(db, user_id)
+    if fresh:
+        return
+    remaining = db.query(func.count(HabitLog.id)).filter(
+        HabitLog.user_id == user_id,
+        HabitLog.completed_date == day,
+    ).scalar() or 0
+    if remaining == 0 and counters.total_days > 0:
+        counters.total_days -= 1
+
+
+def recount_days(db: Session, user_ids: Iterable) -> None:
+    """Массовое удаление логов (выход из привычки, удаление привычки): пересчитать total_days."""
+    for user_id in set(user_ids):
+        counters, fresh = _load_counters(db, user_id)
+        if not fresh:
+            counters.total_days = _count_total_days(db, user_id)
+
+
+def on_friendship_accepted(db: Session, user_ids: Iterable) -> None:
+    """Дружба стала принятой: +1 друг каждой стороне; friends_count проверяется в фоне."""
+    for user_id in user_ids:
+        counters, fresh = _load_counters(db, user_id)
+        if not fresh:
+            counters.friends_count += 1
+        schedule_evaluation(db, user_id, ["friends_count"])
+
+
+def on_friendship_removed(db: Session, user_ids: Iterable) -> None:
+    """Принятая дружба удалена."""
+    for user_id in user_ids:
+        counters, fresh = _load_counters(db, user_id)
+        if not fresh and counters.friends_count > 0:
+            counters.friends_count -= 1
+
+
+def on_invitation_accepted(db: Session, owner_id, habit_id, accepted_count: int) -> None:
+    """Приглашение в привычку принято: лучший состав привычки владельца и habit_invites."""
+    counters, _ = _load_counters(db, owner_id)
+    counters.best_habit_participants = max(counters.best_habit_participants or 0, accepted_count)
+    schedule_evaluation(db, owner_id, ["habit_invites"], habit_id=habit_id)
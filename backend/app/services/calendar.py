@@ -0,0 +1,179 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import HabitLog, HabitCalendar
+
+# 366 бит на год; порядок бит совпадает с set_bit/get_bit в PostgreSQL:
+# бит n лежит в байте n // 8 и является в нём (n % 8)-м младшим битом.
+YEAR_BYTES = 46
+EMPTY_YEAR = bytes(YEAR_BYTES)
+
+
+def day_bit(day: date) -> int:
+    """Номер бита дня в годовом календаре (0 = 1 января)."""
+    return day.timetuple().tm_yday - 1
+
+
+def pack_days(days: Iterable[date]) -> bytes:
+    value = 0
+    for d in days:
+        value |= 1 << day_bit(d)
+    return value.to_bytes(YEAR_BYTES, "little")
+
+
+def to_int(bits) -> int:
+    return int.from_bytes(bytes(bits or b""), "little")
+
+
+def days_from_int(year: int, value: int, start: Optional[date] = None, end: Optional[date] = None) -> List[date]:
+    """Развернуть битовую маску года в список дат (опционально в пределах [start, end])."""
+    if (start is not None and start.year > year) or (end is not None and end.year < year):
+        return []
+    if start is not None and start.year == year:
+        value &= ~((1 << day_bit(start)) - 1)
+    if end is not None and end.year == year:
+        value &= (1 << (day_bit(end) + 1)) - 1
+    first = date(year, 1, 1)
+    result = []
+    while value:
+        low = value & -value
+        result.append(first + timedelta(days=low.bit_length() - 1))
+        value ^= low
+    return result
+
+
+def mark_day(db: Session, habit_id, user_id, day: date) -> None:
+    """Поставить бит дня (атомарно, без чтения строки)."""
+    stmt = insert(HabitCalendar).values(
+        habit_id=habit_id,
+        user_id=user_id,
+        year=day.year,
+        bits=pack_days([day]),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[HabitCalendar.habit_id, HabitCalendar.user_id, HabitCalendar.year],
+        set_={"bits": func.set_bit(HabitCalendar.bits, day_bit(day), 1)},
+    )
+    db.execute(stmt)
+
+
+def clear_day(db: Session, habit_id, user_id, day: date) -> None:
+    """Снять бит дня."""
+    db.query(HabitCalendar).filter(
+        HabitCalendar.habit_id == habit_id,
+        HabitCalendar.user_id == user_id,
+        HabitCalendar.year == day.year,
+    ).update(
+        {"bits": func.set_bit(HabitCalendar.bits, day_bit(day), 0)},
+        synchronize_session=False,
+    )
+
+
+def drop_user(db: Session, habit_id, user_id) -> None:
+    """Удалить календари участника по привычке (вместе с его логами)."""
+    db.query(HabitCalendar).filter(
+        HabitCalendar.habit_id == habit_id,
+        HabitCalendar.user_id == user_id,
+    ).delete(synchronize_session=False)
+
+
+def load(db: Session, habit_ids: List, years: Iterable[int], user_ids: Optional[List] = None) -> Dict:
+    """Маски {(habit_id, user_id, year): int} для набора привычек и лет одним запросом."""
+    if not habit_ids:
+        return {}
+    query = db.query(HabitCalendar.habit_id, HabitCalendar.user_id, HabitCalendar.year, HabitCalendar.bits).filter(
+        HabitCalendar.habit_id.in_(habit_ids),
+        HabitCalendar.year.in_(list(years)),
+    )
+    if user_ids is not None:
+        query = query.filter(HabitCalendar.user_id.in_(user_ids))
+    return {(r.habit_id, r.user_id, r.year): to_int(r.bits) for r in query.all()}
+
+
+def user_days(db: Session, habit_id, user_id, year: Optional[int] = None) -> List[date]:
+    """Все дни с отметкой участника (за год или за всю историю), по возрастанию."""
+    query = db.query(HabitCalendar.year, HabitCalendar.bits).filter(
+        HabitCalendar.habit_id == habit_id,
+        HabitCalendar.user_id == user_id,
+    )
+    if year is not None:
+        query = query.filter(HabitCalendar.year == year)
+    result = []
+    for row in sorted(query.all(), key=lambda r: r.year):
+        result.extend(days_from_int(row.year, to_int(row.bits)))
+    return result
+
+
+def joint_days(db: Session, habit_id, user_ids: List) -> List[date]:
+    """Дни, отмеченные всеми участниками: побитовое И их календарей."""
+    if not user_ids:
+        return []
+    rows = db.query(HabitCalendar.user_id, HabitCalendar.year, HabitCalendar.bits).filter(
+        HabitCalendar.habit_id == habit_id,
+        HabitCalendar.user_id.in_(user_ids),
+    ).all()
+    by_year: Dict = defaultdict(dict)
+    for row in rows:
+        by_year[row.year][row.user_id] = to_int(row.bits)
+    result = []
+    for year in sorted(by_year):
+        masks = by_year[year]
+        if len(masks) < len(set(user_ids)):
+            continue
+        value = -1
+        for mask in masks.values():
+            value &= mask
+        result.extend(days_from_int(year, value))
+    return result
+
+
+def all_done(db: Session, habit_id, user_ids: List, day: date) -> bool:
+    """Отмечен ли день всеми участниками."""
+    if not user_ids:
+        return False
+    bit = day_bit(day)
+    done = db.query(func.count(HabitCalendar.id)).filter(
+        HabitCalendar.habit_id == habit_id,
+        HabitCalendar.user_id.in_(user_ids),
+        HabitCalendar.year == day.year,
+        func.get_bit(HabitCalendar.bits, bit) == 1,
+    ).scalar() or 0
+    return done >= len(set(user_ids))
+
+
+def user_years(db: Session, user_id) -> List[int]:
+    """Годы, в которых у пользователя есть хотя бы одна отметка."""
+    rows = db.query(HabitCalendar.year).filter(
+        HabitCalendar.user_id == user_id,
+        HabitCalendar.bits != EMPTY_YEAR,
+    ).distinct().order_by(HabitCalendar.year).all()
+    return [r[0] for r in rows]
+
+
+def user_year_bits(db: Session, user_id, year: int) -> Dict:
+    """Непустые календари пользователя за год по всем привычкам: {habit_id: bytes}."""
+    rows = db.query(HabitCalendar.habit_id, HabitCalendar.bits).filter(
+        HabitCalendar.user_id == user_id,
+        HabitCalendar.year == year,
+        HabitCalendar.bits != EMPTY_YEAR,
+    ).all()
+    return {r.habit_id: bytes(r.bits) for r in rows}
+
+
+def rebuild_all(db: Session) -> int:
+    """Пересобрать все календари по habit_logs. Возвращает число строк календаря."""
+    rows = db.query(HabitLog.habit_id, HabitLog.user_id, HabitLog.completed_date.label("date")).distinct().all()
+    grouped: Dict = defaultdict(list)
+    for row in rows:
+        grouped[(row.habit_id, row.user_id, row.date.year)].append(row.date)
+
+    db.query(HabitCalendar).delete(synchronize_session=False)
+    for (habit_id, user_id, year), days in grouped.items():
+        db.add(HabitCalendar(habit_id=habit_id, user_id=user_id, year=year, bits=pack_days(days)))
+    db.flush()
+    return len(grouped)
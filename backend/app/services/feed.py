@@ -0,0 +1,37 @@
+from uuid import UUID
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models import Habit, HabitParticipant, FeedEvent
+from app.services import jobs
+
+
+def schedule_completed(db: Session, habit_id, actor_id) -> None:
+    """Отложить рассылку события completed участникам привычки."""
+    jobs.enqueue(db, "feed.completed", {"habit_id": str(habit_id), "actor_id": str(actor_id)})
+
+
+@jobs.handler("feed.completed")
+def _completed_job(db: Session, payload: dict) -> None:
+    """completed -> самому участнику, остальным принятым участникам и создателю (одной пачкой)."""
+    habit_id = UUID(payload["habit_id"])
+    actor_id = UUID(payload["actor_id"])
+    habit = db.query(Habit.created_by, Habit.is_shared).filter(Habit.id == habit_id).first()
+    if habit is None:
+        return
+
+    recipient_ids = {actor_id}
+    if habit.is_shared:
+        rows = db.query(HabitParticipant.user_id).filter(
+            HabitParticipant.habit_id == habit_id,
+            HabitParticipant.status == "accepted",
+        ).all()
+        recipient_ids.update(r[0] for r in rows)
+        if habit.created_by:
+            recipient_ids.add(habit.created_by)
+
+    db.execute(insert(FeedEvent), [
+        {"user_id": recipient_id, "actor_id": actor_id, "habit_id": habit_id, "event_type": "completed"}
+        for recipient_id in recipient_ids
+    ])
@@ -0,0 +1,83 @@
+from typing import FrozenSet, Iterable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models import Friendship, FriendEdge
+
+# users.id -> ID принятых друзей. Общий для всех путей рассылки (лента достижений, удаление профиля);
+# сбрасывается явно при добавлении, принятии и удалении дружбы и при удалении аккаунта.
+# Кэш у каждого процесса свой: изменения из других процессов видны не позже FRIENDS_CACHE_TTL.
+_adjacency = TTLCache(maxsize=settings.FRIENDS_CACHE_SIZE, ttl=settings.FRIENDS_CACHE_TTL)
+
+
+def accepted_friend_ids(db: Session, user_id, use_cache: bool = True) -> FrozenSet:
+    """
+    ID принятых друзей пользователя (из кэша смежности или одним запросом).
+    use_cache=False — точный список из БД, когда по нему правятся счётчики.
+    """
+    cached = _adjacency.get(user_id) if use_cache else None
+    if cached is not None:
+        return cached
+    friend_rows = db.query(FriendEdge.friend_id).filter(
+        FriendEdge.user_id == user_id,
+        FriendEdge.status == "accepted",
+    ).all()
+    friend_ids = frozenset(fr.friend_id for fr in friend_rows)
+    # незакоммиченные изменения дружб этой сессии в кэш не попадают
+    if not db.info.get("friends_invalidated"):
+        _adjacency.set(user_id, friend_ids)
+    return friend_ids
+
+
+def save_edges(db: Session, friendship: Friendship) -> None:
+    """
+    Записать обе направленные связи дружбы (user -> friend и friend -> user) с её текущим статусом
+    в той же транзакции. Удалять связи не нужно: они удаляются каскадом вместе с дружбой.
+    """
+    db.flush()
+    stmt = pg_insert(FriendEdge).values([
+        {"user_id": friendship.user_id, "friend_id": friendship.friend_id,
+         "friendship_id": friendship.id, "status": friendship.status},
+        {"user_id": friendship.friend_id, "friend_id": friendship.user_id,
+         "friendship_id": friendship.id, "status": friendship.status},
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[FriendEdge.user_id, FriendEdge.friend_id],
+        set_={"friendship_id": stmt.excluded.friendship_id, "status": stmt.excluded.status},
+    ))
+
+
+def friendship_between(db: Session, user_id, other_id) -> Optional[Friendship]:
+    """Дружба двух пользователей в любом направлении — по первичному ключу связи."""
+    return db.query(Friendship).join(
+        FriendEdge, FriendEdge.friendship_id == Friendship.id
+    ).filter(
+        FriendEdge.user_id == user_id,
+        FriendEdge.friend_id == other_id,
+    ).first()
+
+
+def invalidate(db: Session, user_ids: Iterable) -> None:
+    """
+    Сбросить списки друзей пользователей: сразу и ещё раз после commit, чтобы параллельный
+    запрос не успел закэшировать состояние до фиксации транзакции.
+    """
+    user_ids = set(user_ids)
+    for user_id in user_ids:
+        _adjacency.pop(user_id)
+    db.info.setdefault("friends_invalidated", set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    for user_id in session.info.pop("friends_invalidated", ()):
+        _adjacency.pop(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop("friends_invalidated", None)
@@ -0,0 +1,136 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Sequence
+
+from sqlalchemy.orm import Session, joinedload
+
+from app.models import User, Habit, HabitParticipant
+from app.services import calendar
+from app.services.streaks import get_joint_max_streaks
+
+
+def _user_dict(u: User):
+    if not u:
+        return None
+    return {
+        "id": u.id,
+        "username": u.username,
+        "first_name": u.first_name,
+        "last_name": u.last_name,
+        "avatar_emoji": u.avatar_emoji,
+        "bio": u.bio,
+    }
+
+
+def build_habit_payloads(
+    db: Session,
+    habits: Sequence[Habit],
+    current_user: User,
+    with_progress: bool = True,
+) -> List[dict]:
+    """
+    Собрать ответы HabitSchema для набора привычек за фиксированное число запросов.
+
+    Участники вместе с пользователями грузятся одним запросом (IN + JOIN),
+    календари текущей недели и совместные серии — ещё по одному запросу на всю пачку.
+    Число запросов не зависит от количества привычек и участников.
+    """
+    if not habits:
+        return []
+
+    habit_ids = [h.id for h in habits]
+
+    participants_by_habit: Dict = defaultdict(list)
+    participants = (
+        db.query(HabitParticipant)
+        .options(joinedload(HabitParticipant.user))
+        .filter(HabitParticipant.habit_id.in_(habit_ids))
+        .all()
+    )
+    for p in participants:
+        participants_by_habit[p.habit_id].append(p)
+
+    # Текущая неделя (пн–вс) для отображения выполнений
+    today = date.today()
+    week_start = today - timedelta(days=today.weekday())  # понедельник
+    week_end = week_start + timedelta(days=6)
+
+    week_days: Dict = defaultdict(list)
+    joint_streaks: Dict = {}
+    if with_progress:
+        # Дни недели берутся из битовых календарей habit_calendars (неделя может захватывать два года)
+        masks = calendar.load(db, habit_ids, {week_start.year, week_end.year})
+        for (habit_id, user_id, year), value in masks.items():
+            for d in calendar.days_from_int(year, value, week_start, week_end):
+                week_days[habit_id].append((d, user_id))
+
+        # Совместные серии хранятся в habit_joint_streaks и не требуют чтения истории
+        joint_streaks = get_joint_max_streaks(db, habit_ids)
+
+    result = []
+    for habit in habits:
+        habit_participants = participants_by_habit.get(habit.id, [])
+        participants_by_user = {p.user_id: p for p in habit_participants}
+        accepted_ids = {
+            p.user_id for p in habit_participants if getattr(p, "status", "accepted") == "accepted"
+        }
+
+        has_pending_invites = False
+        is_invited = False
+        for p in habit_participants:
+            if p.user_id == current_user.id and getattr(p, "status", "accepted") == "pending":
+                is_invited = True
+            if habit.created_by == current_user.id and p.user_id != current_user.id and getattr(p, "status", "accepted") == "pending":
+                has_pending_invites = True
+
+        habit_dict = {
+            "id": habit.id,
+            "name": habit.name,
+            "description": habit.description,
+            "frequency": habit.frequency,
+            "is_shared": habit.is_shared,
+            "created_by": habit.created_by,
+            "created_at": habit.created_at,
+            "updated_at": habit.updated_at,
+            "color": getattr(habit, "color", None),
+            "days_of_week": getattr(habit, "days_of_week", None),
+            "weekly_goal_days": getattr(habit, "weekly_goal_days", None),
+            "reminder_enabled": getattr(habit, "reminder_enabled", None),
+            "reminder_time": getattr(habit, "reminder_time", None),
+            "participants": [
+                {
+                    "id": p.user_id,
+                    "joined_at": p.joined_at,
+                    "status": getattr(p, "status", "accepted"),
+                    "color": getattr(p, "color", None),
+                    "reminder_enabled": getattr(p, "reminder_enabled", None),
+                    "reminder_time": getattr(p, "reminder_time", None),
+                    "user": _user_dict(p.user),
+                }
+                for p in habit_participants
+            ],
+            "has_pending_invites": has_pending_invites,
+            "is_invited": is_invited,
+            "can_edit": habit.created_by == current_user.id,
+        }
+
+        if with_progress:
+            current_week_completions = []
+            weekly_participant_completions = {}
+            for d, user_id in sorted(week_days.get(habit.id, []), key=lambda item: item[0]):
+                day_str = str(d)
+                if user_id == current_user.id:
+                    current_week_completions.append(day_str)
+                if user_id in accepted_ids:
+                    participant = participants_by_user.get(user_id)
+                    weekly_participant_completions.setdefault(day_str, []).append(
+                        {"user_id": user_id, "color": getattr(participant, "color", None)}
+                    )
+
+            habit_dict["current_week_completions"] = current_week_completions
+            habit_dict["current_streak"] = joint_streaks.get(habit.id, 0)
+            habit_dict["weekly_participant_completions"] = weekly_participant_completions
+
+        result.append(habit_dict)
+
+    return result
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# kind -> обработчик(db, payload). Обработчик не коммитит: результат фиксируется
+# в одной транзакции с удалением задачи.
+HANDLERS: Dict[str, Callable[[Session, dict], None]] = {}
+
+
+def handler(kind: str):
+    """Зарегистрировать обработчик задачи."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue(db: Session, kind: str, payload: dict) -> None:
+    """Поставить задачу в той же транзакции, что и основная запись."""
+    db.add(BackgroundJob(kind=kind, payload=payload))
+    db.info["jobs_enqueued"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _kick_after_commit(session: Session) -> None:
+    if session.info.pop("jobs_enqueued", False):
+        runner.kick()
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(2 ** attempts, 300) * (0.5 + random.random()))
+
+
+def run_next() -> bool:
+    """Взять одну готовую задачу (SKIP LOCKED) и выполнить её. False — задач нет."""
+    db = SessionLocal()
+    try:
+        now = datetime.now(timezone.utc)
+        job = db.query(BackgroundJob).filter(
+            BackgroundJob.status.in_(["pending", "running"]),
+            BackgroundJob.run_after <= now,
+        ).order_by(BackgroundJob.run_after).with_for_update(skip_locked=True).first()
+        if job is None:
+            db.rollback()
+            return False
+
+        job.status = "running"
+        job.attempts += 1
+        job.run_after = now + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        db.commit()
+        job_id, kind, payload, attempts = job.id, job.kind, job.payload, job.attempts
+
+        try:
+            fn = HANDLERS.get(kind)
+            if fn is None:
+                raise RuntimeError(f"No handler for job kind {kind!r}")
+            fn(db, payload)
+            db.query(BackgroundJob).filter(BackgroundJob.id == job_id).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.exception("Background job %s (%s) failed, attempt %d", job_id, kind, attempts)
+            failed = attempts >= settings.JOB_MAX_ATTEMPTS
+            db.query(BackgroundJob).filter(BackgroundJob.id == job_id).update({
+                "status": "failed" if failed else "pending",
+                "run_after": datetime.now(timezone.utc) + _backoff(attempts),
+                "last_error": str(e)[:1000],
+            }, synchronize_session=False)
+            db.commit()
+        return True
+    finally:
+        db.close()
+
+
+class JobRunner:
+    """Пул из JOB_WORKERS асинхронных воркеров; задачи выполняются в потоках с отдельной сессией."""
+
+    def __init__(self) -> None:
+        self._tasks = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self, workers: int = settings.JOB_WORKERS) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def kick(self) -> None:
+        """Разбудить воркеров (потокобезопасно)."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _worker(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                ran = await asyncio.to_thread(run_next)
+            except Exception as e:
+                logger.error("Job worker error: %s", e)
+                ran = False
+            if ran:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+runner = JobRunner()
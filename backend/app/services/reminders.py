@@ -0,0 +1,144 @@
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy.orm import Session
+
+from app.models import User, Habit, HabitParticipant, ReminderSlot
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+DEFAULT_TIMEZONE = "Europe/Moscow"
+
+
+def get_zone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def is_valid_timezone(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def minute_of_week(moment: datetime) -> int:
+    """Минута недели момента в UTC (0 = понедельник 00:00)."""
+    moment = moment.astimezone(timezone.utc) if moment.tzinfo else moment
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def _parse_time(value: Optional[str]) -> Optional[int]:
+    try:
+        hour, minute = map(int, (value or "").split(":"))
+    except ValueError:
+        return None
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        return None
+    return hour * 60 + minute
+
+
+def slot_minutes(days_of_week: Optional[List[int]], reminder_time: Optional[str], tz_name: Optional[str],
+                 now: Optional[datetime] = None) -> List[int]:
+    """
+    UTC-минуты недели для напоминания в reminder_time (местное время) по дням days_of_week
+    (1 = Пн … 7 = Вс; пусто — каждый день). Смещение пояса берётся на момент now,
+    поэтому после перехода на летнее/зимнее время слоты пересобираются
+    (refresh_changed_offsets).
+    """
+    local_minute = _parse_time(reminder_time)
+    if local_minute is None:
+        return []
+    offset = get_zone(tz_name).utcoffset(now or datetime.now(timezone.utc))
+    offset_minutes = int(offset.total_seconds() // 60) if offset else 0
+    days = sorted({d for d in (days_of_week or []) if 1 <= d <= 7}) or list(range(1, 8))
+    return sorted({
+        ((d - 1) * MINUTES_PER_DAY + local_minute - offset_minutes) % MINUTES_PER_WEEK
+        for d in days
+    })
+
+
+def _replace_slots(db: Session, participants: Iterable, habits: dict, users: dict,
+                   now: Optional[datetime] = None, clear: bool = True) -> None:
+    participants = list(participants)
+    if not participants:
+        return
+    if clear:
+        db.query(ReminderSlot).filter(
+            ReminderSlot.participant_id.in_([p.id for p in participants])
+        ).delete(synchronize_session=False)
+    rows = []
+    for p in participants:
+        if p.status != "accepted" or not p.reminder_enabled or not p.reminder_time:
+            continue
+        habit = habits.get(p.habit_id)
+        user = users.get(p.user_id)
+        if habit is None or user is None:
+            continue
+        for minute in slot_minutes(habit.days_of_week, p.reminder_time, user.timezone, now):
+            rows.append(ReminderSlot(participant_id=p.id, habit_id=p.habit_id, user_id=p.user_id, minute_of_week=minute))
+    db.add_all(rows)
+
+
+def sync_participant(db: Session, participant: HabitParticipant) -> None:
+    """Пересобрать слоты участника после изменения его напоминания или статуса."""
+    db.flush()
+    habit = db.query(Habit).filter(Habit.id == participant.habit_id).first()
+    user = db.query(User).filter(User.id == participant.user_id).first()
+    _replace_slots(db, [participant], {habit.id: habit} if habit else {}, {user.id: user} if user else {})
+
+
+def sync_habit(db: Session, habit: Habit) -> None:
+    """Расписание привычки изменилось: пересобрать слоты всех участников."""
+    db.flush()
+    participants = db.query(HabitParticipant).filter(HabitParticipant.habit_id == habit.id).all()
+    user_ids = [p.user_id for p in participants]
+    users = {u.id: u for u in db.query(User).filter(User.id.in_(user_ids)).all()} if user_ids else {}
+    _replace_slots(db, participants, {habit.id: habit}, users)
+
+
+def sync_user(db: Session, user: User) -> None:
+    """Пояс пользователя изменился: пересобрать слоты всех его участий."""
+    db.flush()
+    participants = db.query(HabitParticipant).filter(HabitParticipant.user_id == user.id).all()
+    habit_ids = [p.habit_id for p in participants]
+    habits = {h.id: h for h in db.query(Habit).filter(Habit.id.in_(habit_ids)).all()} if habit_ids else {}
+    _replace_slots(db, participants, habits, {user.id: user})
+
+
+def rebuild_all(db: Session, now: Optional[datetime] = None) -> int:
+    """Пересобрать все слоты (первичное заполнение, смена летнего/зимнего времени)."""
+    participants = db.query(HabitParticipant).filter(
+        HabitParticipant.status == "accepted",
+        HabitParticipant.reminder_enabled == True,
+        HabitParticipant.reminder_time != None,
+    ).all()
+    db.query(ReminderSlot).delete(synchronize_session=False)
+    habit_ids = list({p.habit_id for p in participants})
+    user_ids = list({p.user_id for p in participants})
+    habits = {h.id: h for h in db.query(Habit).filter(Habit.id.in_(habit_ids)).all()} if habit_ids else {}
+    users = {u.id: u for u in db.query(User).filter(User.id.in_(user_ids)).all()} if user_ids else {}
+    _replace_slots(db, participants, habits, users, now, clear=False)
+    db.flush()
+    return db.query(ReminderSlot).count()
+
+
+def refresh_changed_offsets(db: Session, since: datetime, now: datetime) -> int:
+    """
+    Пересобрать слоты пользователей, у чьих поясов смещение изменилось между since и now
+    (переход на летнее/зимнее время). Возвращает число затронутых пользователей.
+    """
+    zones = [r[0] for r in db.query(User.timezone).join(
+        ReminderSlot, ReminderSlot.user_id == User.id
+    ).distinct().all()]
+    changed = [z for z in zones if get_zone(z).utcoffset(since) != get_zone(z).utcoffset(now)]
+    if not changed:
+        return 0
+    users = db.query(User).filter(User.timezone.in_(changed)).all()
+    for user in users:
+        sync_user(db, user)
+    return len(users)
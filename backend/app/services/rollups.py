@@ -0,0 +1,88 @@
+from datetime import date, timedelta
+
+from sqlalchemy import delete, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models import HabitLog, HabitDailyRollup, HabitWeeklyRollup
+
+
+def week_start(day: date) -> date:
+    """Понедельник недели, в которую попадает день."""
+    return day - timedelta(days=day.weekday())
+
+
+def record_day(db: Session, habit_id, user_id, day: date) -> None:
+    """Отметка за день: строка дневной сводки и +1 к недельной (если дня ещё не было)."""
+    added = db.execute(
+        insert(HabitDailyRollup)
+        .values(habit_id=habit_id, user_id=user_id, day=day)
+        .on_conflict_do_nothing()
+        .returning(HabitDailyRollup.day)
+    ).first()
+    if added is None:
+        return
+    stmt = insert(HabitWeeklyRollup).values(
+        habit_id=habit_id,
+        user_id=user_id,
+        week_start=week_start(day),
+        days_done=1,
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[HabitWeeklyRollup.habit_id, HabitWeeklyRollup.user_id, HabitWeeklyRollup.week_start],
+        set_={"days_done": HabitWeeklyRollup.days_done + 1},
+    ))
+
+
+def remove_day(db: Session, habit_id, user_id, day: date) -> None:
+    """Снятие отметки: удалить строку дня и уменьшить недельную сводку (пустая неделя удаляется)."""
+    removed = db.execute(
+        delete(HabitDailyRollup)
+        .where(
+            HabitDailyRollup.habit_id == habit_id,
+            HabitDailyRollup.user_id == user_id,
+            HabitDailyRollup.day == day,
+        )
+        .returning(HabitDailyRollup.day)
+    ).first()
+    if removed is None:
+        return
+    week = (
+        HabitWeeklyRollup.habit_id == habit_id,
+        HabitWeeklyRollup.user_id == user_id,
+        HabitWeeklyRollup.week_start == week_start(day),
+    )
+    db.execute(update(HabitWeeklyRollup).where(*week).values(days_done=HabitWeeklyRollup.days_done - 1))
+    db.execute(delete(HabitWeeklyRollup).where(*week, HabitWeeklyRollup.days_done <= 0))
+
+
+def drop_user(db: Session, habit_id, user_id) -> None:
+    """Удалить сводки участника (выход или удаление из привычки)."""
+    db.execute(delete(HabitDailyRollup).where(
+        HabitDailyRollup.habit_id == habit_id,
+        HabitDailyRollup.user_id == user_id,
+    ))
+    db.execute(delete(HabitWeeklyRollup).where(
+        HabitWeeklyRollup.habit_id == habit_id,
+        HabitWeeklyRollup.user_id == user_id,
+    ))
+
+
+def rebuild_all(db: Session) -> int:
+    """Пересобрать дневные и недельные сводки по habit_logs. Возвращает число дневных строк."""
+    db.execute(delete(HabitWeeklyRollup))
+    db.execute(delete(HabitDailyRollup))
+
+    db.execute(insert(HabitDailyRollup).from_select(
+        ["habit_id", "user_id", "day"],
+        select(HabitLog.habit_id, HabitLog.user_id, HabitLog.completed_date).distinct(),
+    ))
+    # date_trunc('week') в PostgreSQL возвращает понедельник — как week_start()
+    week = func.date(func.date_trunc(literal_column("'week'"), HabitDailyRollup.day))
+    db.execute(insert(HabitWeeklyRollup).from_select(
+        ["habit_id", "user_id", "week_start", "days_done"],
+        select(HabitDailyRollup.habit_id, HabitDailyRollup.user_id, week, func.count())
+        .group_by(HabitDailyRollup.habit_id, HabitDailyRollup.user_id, week),
+    ))
+    db.flush()
+    return db.query(func.count()).select_from(HabitDailyRollup).scalar() or 0
@@ -0,0 +1,234 @@
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models import HabitParticipant, HabitCalendar, HabitStreak, HabitJointStreak
+from app.services import calendar
+
+
+def max_consecutive(dates: Iterable[date]) -> int:
+    """Максимальная серия подряд идущих дней в наборе дат."""
+    ordered = sorted(set(dates))
+    if not ordered:
+        return 0
+    cur = 1
+    best = 1
+    for i in range(1, len(ordered)):
+        if (ordered[i] - ordered[i - 1]).days == 1:
+            cur += 1
+            if cur > best:
+                best = cur
+        else:
+            cur = 1
+    return best
+
+
+def run_ending_at(dates: Iterable[date], day: date) -> int:
+    """Длина серии подряд идущих дней, заканчивающейся в day."""
+    dset = set(dates)
+    streak = 0
+    while day in dset:
+        streak += 1
+        day = day - timedelta(days=1)
+    return streak
+
+
+def alive_streak(state, today: Optional[date] = None) -> int:
+    """Текущая серия на сегодня: считается, если последняя отметка сегодня или вчера."""
+    if state is None or state.last_date is None:
+        return 0
+    today = today or date.today()
+    if state.last_date >= today - timedelta(days=1):
+        return state.current_streak or 0
+    return 0
+
+
+def _fill(state, dates: List[date]) -> None:
+    if not dates:
+        state.current_streak = 0
+        state.max_streak = 0
+        state.last_date = None
+        return
+    last = max(dates)
+    state.last_date = last
+    state.current_streak = run_ending_at(dates, last)
+    state.max_streak = max_consecutive(dates)
+
+
+def _advance(state, day: date) -> bool:
+    """Продлить серию днём после last_date. False — день в прошлом, нужен пересчёт."""
+    if state.last_date is not None and day <= state.last_date:
+        return False
+    if state.last_date is not None and (day - state.last_date).days == 1:
+        state.current_streak = (state.current_streak or 0) + 1
+    else:
+        state.current_streak = 1
+    state.last_date = day
+    state.max_streak = max(state.max_streak or 0, state.current_streak)
+    return True
+
+
+def _accepted_ids(db: Session, habit_id) -> List:
+    rows = db.query(HabitParticipant.user_id).filter(
+        HabitParticipant.habit_id == habit_id,
+        HabitParticipant.status == "accepted",
+    ).all()
+    return [r[0] for r in rows]
+
+
+def _user_state(db: Session, habit_id, user_id, lock: bool = False) -> Optional[HabitStreak]:
+    query = db.query(HabitStreak).filter(
+        HabitStreak.habit_id == habit_id,
+        HabitStreak.user_id == user_id,
+    )
+    if lock:
+        # параллельные отметки не должны терять обновления серии
+        query = query.with_for_update()
+    return query.first()
+
+
+def _joint_state(db: Session, habit_id, lock: bool = False) -> Optional[HabitJointStreak]:
+    query = db.query(HabitJointStreak).filter(HabitJointStreak.habit_id == habit_id)
+    if lock:
+        query = query.with_for_update()
+    return query.first()
+
+
+def _locked_user_state(db: Session, habit_id, user_id) -> Tuple[HabitStreak, bool]:
+    """
+    Серия участника под блокировкой строки. Если строки нет, она создаётся через
+    INSERT ... ON CONFLICT DO NOTHING (параллельная первая отметка не падает на уникальном ключе);
+    второй элемент — True, если строку создал этот вызов и её нужно заполнить.
+    """
+    state = _user_state(db, habit_id, user_id, lock=True)
+    if state is not None:
+        return state, False
+    created = db.execute(
+        pg_insert(HabitStreak)
+        .values(habit_id=habit_id, user_id=user_id)
+        .on_conflict_do_nothing(index_elements=[HabitStreak.habit_id, HabitStreak.user_id])
+        .returning(HabitStreak.id)
+    ).first()
+    state = db.query(HabitStreak).filter(
+        HabitStreak.habit_id == habit_id,
+        HabitStreak.user_id == user_id,
+    ).with_for_update().populate_existing().one()
+    return state, created is not None
+
+
+def _locked_joint_state(db: Session, habit_id) -> HabitJointStreak:
+    """Совместная серия под блокировкой строки; строка создаётся так же, как в _locked_user_state."""
+    state = _joint_state(db, habit_id, lock=True)
+    if state is not None:
+        return state
+    db.execute(
+        pg_insert(HabitJointStreak)
+        .values(habit_id=habit_id)
+        .on_conflict_do_nothing(index_elements=[HabitJointStreak.habit_id])
+    )
+    return db.query(HabitJointStreak).filter(
+        HabitJointStreak.habit_id == habit_id
+    ).with_for_update().populate_existing().one()
+
+
+def recompute_user_streak(db: Session, habit_id, user_id) -> HabitStreak:
+    """Полный пересчёт серии участника по календарю (редкий путь: правки задним числом)."""
+    db.flush()
+    state, _ = _locked_user_state(db, habit_id, user_id)
+    _fill(state, calendar.user_days(db, habit_id, user_id))
+    return state
+
+
+def recompute_joint_streak(db: Session, habit_id) -> HabitJointStreak:
+    """Полный пересчёт совместной серии (пересечение дней всех принятых участников)."""
+    db.flush()
+    state = _locked_joint_state(db, habit_id)
+    _fill(state, calendar.joint_days(db, habit_id, _accepted_ids(db, habit_id)))
+    return state
+
+
+def record_completion(db: Session, habit_id, user_id, day: date) -> int:
+    """
+    Учесть новую отметку за day. Возвращает серию участника, заканчивающуюся в day.
+
+    Отметка за следующий после last_date день продлевает серию без чтения истории;
+    отметка задним числом пересчитывает состояние целиком по календарю habit_calendars.
+    Календарь должен быть обновлён до вызова.
+    """
+    db.flush()
+    state, created = _locked_user_state(db, habit_id, user_id)
+    if not created and _advance(state, day):
+        streak = state.current_streak
+    else:
+        dates = calendar.user_days(db, habit_id, user_id)
+        _fill(state, dates)
+        streak = run_ending_at(dates, day)
+
+    joint = _joint_state(db, habit_id, lock=True)
+    if joint is None:
+        recompute_joint_streak(db, habit_id)
+        return streak
+
+    participant_ids = _accepted_ids(db, habit_id)
+    if not participant_ids:
+        return streak
+    if calendar.all_done(db, habit_id, participant_ids, day) and not _advance(joint, day):
+        recompute_joint_streak(db, habit_id)
+    return streak
+
+
+def record_removal(db: Session, habit_id, user_id, day: date) -> None:
+    """Учесть удаление отметки за day."""
+    recompute_user_streak(db, habit_id, user_id)
+    joint = _joint_state(db, habit_id)
+    if joint is None or (joint.last_date is not None and day <= joint.last_date):
+        recompute_joint_streak(db, habit_id)
+
+
+def drop_participant(db: Session, habit_id, user_id) -> None:
+    """Участник покинул привычку: его серия удаляется, совместная пересчитывается."""
+    db.flush()
+    db.query(HabitStreak).filter(
+        HabitStreak.habit_id == habit_id,
+        HabitStreak.user_id == user_id,
+    ).delete(synchronize_session=False)
+    recompute_joint_streak(db, habit_id)
+
+
+def get_user_streak(db: Session, habit_id, user_id, today: Optional[date] = None) -> int:
+    """Текущая серия участника без чтения истории."""
+    return alive_streak(_user_state(db, habit_id, user_id), today)
+
+
+def load_user_states(db: Session, habit_ids: List, user_ids: List) -> Dict:
+    """Состояния серий {(habit_id, user_id): HabitStreak} для пачки участников одним запросом."""
+    if not habit_ids or not user_ids:
+        return {}
+    rows = db.query(HabitStreak).filter(
+        HabitStreak.habit_id.in_(habit_ids),
+        HabitStreak.user_id.in_(user_ids),
+    ).all()
+    return {(r.habit_id, r.user_id): r for r in rows}
+
+
+def get_joint_max_streaks(db: Session, habit_ids: List) -> Dict:
+    """Максимальные совместные серии для набора привычек одним запросом."""
+    if not habit_ids:
+        return {}
+    rows = db.query(HabitJointStreak.habit_id, HabitJointStreak.max_streak).filter(
+        HabitJointStreak.habit_id.in_(habit_ids)
+    ).all()
+    return {r.habit_id: r.max_streak for r in rows}
+
+
+def rebuild_all(db: Session) -> int:
+    """Пересобрать все серии по календарям. Возвращает число привычек."""
+    pairs = db.query(HabitCalendar.habit_id, HabitCalendar.user_id).distinct().all()
+    for habit_id, user_id in pairs:
+        recompute_user_streak(db, habit_id, user_id)
+    habit_ids = {r[0] for r in db.query(HabitParticipant.habit_id).distinct().all()}
+    for habit_id in habit_ids:
+        recompute_joint_streak(db, habit_id)
+    return len(habit_ids)
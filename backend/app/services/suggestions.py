@@ -0,0 +1,147 @@
+from typing import Iterable, Set
+from uuid import UUID
+
+from sqlalchemy import and_, delete, func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, aliased
+
+from app.models import User, FriendEdge, FriendSuggestion, HabitParticipant
+from app.services import jobs
+
+
+def _edge_ids(db: Session, user_id, accepted_only: bool) -> Set:
+    query = db.query(FriendEdge.friend_id).filter(FriendEdge.user_id == user_id)
+    if accepted_only:
+        query = query.filter(FriendEdge.status == "accepted")
+    return {r[0] for r in query.all()}
+
+
+def refresh_pairs(db: Session, user_id, candidate_ids: Iterable) -> None:
+    """
+    Пересчитать пары (user, candidate) и (candidate, user) по текущим связям: число общих
+    друзей и общих привычек симметрично, поэтому обе строки пишутся из одного расчёта.
+    Пересчёт идемпотентен — порядок выполнения задач не важен.
+    """
+    candidate_ids = set(candidate_ids) - {user_id}
+    if not candidate_ids:
+        return
+
+    mine = aliased(FriendEdge)
+    theirs = aliased(FriendEdge)
+    mutual = dict(db.query(theirs.user_id, func.count()).join(
+        mine, mine.friend_id == theirs.friend_id
+    ).filter(
+        mine.user_id == user_id,
+        mine.status == "accepted",
+        theirs.user_id.in_(candidate_ids),
+        theirs.status == "accepted",
+    ).group_by(theirs.user_id).all())
+
+    my_habits = aliased(HabitParticipant)
+    their_habits = aliased(HabitParticipant)
+    shared = dict(db.query(their_habits.user_id, func.count(func.distinct(their_habits.habit_id))).join(
+        my_habits, my_habits.habit_id == their_habits.habit_id
+    ).filter(
+        my_habits.user_id == user_id,
+        my_habits.status == "accepted",
+        their_habits.user_id.in_(candidate_ids),
+        their_habits.status == "accepted",
+    ).group_by(their_habits.user_id).all())
+
+    # друзья и уже отправленные заявки (любая связь) в кандидаты не попадают
+    linked = _edge_ids(db, user_id, accepted_only=False)
+
+    db.execute(delete(FriendSuggestion).where(or_(
+        and_(FriendSuggestion.user_id == user_id, FriendSuggestion.candidate_id.in_(candidate_ids)),
+        and_(FriendSuggestion.candidate_id == user_id, FriendSuggestion.user_id.in_(candidate_ids)),
+    )))
+    rows = []
+    for candidate_id in candidate_ids - linked:
+        m, s = mutual.get(candidate_id, 0), shared.get(candidate_id, 0)
+        if m == 0 and s == 0:
+            continue
+        for a, b in ((user_id, candidate_id), (candidate_id, user_id)):
+            rows.append({"user_id": a, "candidate_id": b, "mutual_friends": m, "shared_habits": s, "score": m + s})
+    if rows:
+        # параллельная задача могла уже вставить ту же пару — значения одинаковые, берём последние
+        stmt = pg_insert(FriendSuggestion).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[FriendSuggestion.user_id, FriendSuggestion.candidate_id],
+            set_={
+                "mutual_friends": stmt.excluded.mutual_friends,
+                "shared_habits": stmt.excluded.shared_habits,
+                "score": stmt.excluded.score,
+                "updated_at": func.now(),
+            },
+        ))
+
+
+def refresh_user(db: Session, user_id) -> None:
+    """Полный пересчёт кандидатов пользователя: друзья друзей и участники общих привычек."""
+    friend_ids = _edge_ids(db, user_id, accepted_only=True)
+    candidates = set()
+    if friend_ids:
+        candidates.update(r[0] for r in db.query(FriendEdge.friend_id).filter(
+            FriendEdge.user_id.in_(friend_ids),
+            FriendEdge.status == "accepted",
+        ).distinct().all())
+    my_habit_ids = db.query(HabitParticipant.habit_id).filter(
+        HabitParticipant.user_id == user_id,
+        HabitParticipant.status == "accepted",
+    )
+    candidates.update(r[0] for r in db.query(HabitParticipant.user_id).filter(
+        HabitParticipant.habit_id.in_(my_habit_ids),
+        HabitParticipant.status == "accepted",
+    ).distinct().all())
+    candidates.discard(user_id)
+
+    # пары с теми, с кем больше ничего не связывает
+    db.execute(delete(FriendSuggestion).where(or_(
+        and_(FriendSuggestion.user_id == user_id, FriendSuggestion.candidate_id.notin_(candidates)),
+        and_(FriendSuggestion.candidate_id == user_id, FriendSuggestion.user_id.notin_(candidates)),
+    )))
+    refresh_pairs(db, user_id, candidates)
+
+
+def rebuild_all(db: Session) -> int:
+    """Пересобрать таблицу кандидатов целиком (первичное заполнение, периодическая сверка)."""
+    db.query(FriendSuggestion).delete(synchronize_session=False)
+    for (user_id,) in db.query(User.id).all():
+        refresh_user(db, user_id)
+    db.flush()
+    return db.query(FriendSuggestion).count()
+
+
+def schedule_friendship_changed(db: Session, user_id, other_id) -> None:
+    """Дружба (или заявка) между двумя пользователями появилась, принята или удалена."""
+    jobs.enqueue(db, "suggestions.friendship", {"user_ids": [str(user_id), str(other_id)]})
+
+
+def schedule_friends_regrouped(db: Session, user_ids: Iterable) -> None:
+    """Общий друг пользователей исчез (удаление аккаунта): пересчитать пары внутри группы."""
+    user_ids = [str(u) for u in user_ids]
+    if len(user_ids) > 1:
+        jobs.enqueue(db, "suggestions.group", {"user_ids": user_ids})
+
+
+def schedule_habit_regrouped(db: Session, user_ids: Iterable) -> None:
+    """Состав привычки изменился (принятие, выход, удаление): пересчитать общие привычки внутри её состава."""
+    schedule_friends_regrouped(db, set(user_ids))
+
+
+@jobs.handler("suggestions.friendship")
+def _friendship_job(db: Session, payload: dict) -> None:
+    """
+    Изменилась связь A–B: меняются общие друзья A с друзьями B (и наоборот) и сама пара A–B.
+    Пересчитываются только эти пары, а не граф целиком.
+    """
+    a, b = (UUID(u) for u in payload["user_ids"])
+    for user_id, other_id in ((a, b), (b, a)):
+        refresh_pairs(db, user_id, _edge_ids(db, other_id, accepted_only=True) | {other_id})
+
+
+@jobs.handler("suggestions.group")
+def _group_job(db: Session, payload: dict) -> None:
+    user_ids = [UUID(u) for u in payload["user_ids"]]
+    for user_id in user_ids:
+        refresh_pairs(db, user_id, user_ids)
@@ -0,0 +1,60 @@
+import os
+import sys
+import logging
+
+from sqlalchemy import text
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.database import SessionLocal  # type: ignore
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+ADD_COLUMN = """
+ALTER TABLE feed_events
+  ADD COLUMN IF NOT EXISTS achievement_id UUID REFERENCES user_achievements(id) ON DELETE SET NULL
+"""
+
+# Старые события не знают своё достижение. Берём достижения автора, полученные не позже
+# чем через 10 секунд после события (прежнее окно воркера уведомлений); если у автора
+# в один момент несколько событий, они получают разные достижения по порядку (rn).
+BACKFILL = """
+WITH ev AS (
+    SELECT id, actor_id, created_at,
+           row_number() OVER (PARTITION BY user_id, actor_id, created_at ORDER BY id) AS rn
+    FROM feed_events
+    WHERE event_type = 'achievement' AND achievement_id IS NULL AND actor_id IS NOT NULL
+),
+matched AS (
+    SELECT ev.id,
+           (SELECT ua.id FROM user_achievements ua
+             WHERE ua.user_id = ev.actor_id
+               AND ua.created_at <= ev.created_at + interval '10 seconds'
+             ORDER BY ua.created_at DESC, ua.type, ua.tier
+             OFFSET ev.rn - 1 LIMIT 1) AS achievement_id
+    FROM ev
+)
+UPDATE feed_events f
+SET achievement_id = matched.achievement_id
+FROM matched
+WHERE f.id = matched.id AND matched.achievement_id IS NOT NULL
+"""
+
+
+def backfill_feed_achievements() -> None:
+    db = SessionLocal()
+    try:
+        db.execute(text(ADD_COLUMN))
+        updated = db.execute(text(BACKFILL)).rowcount
+        db.commit()
+        logging.info("Linked %d achievement feed events", updated)
+    except Exception as e:
+        logging.error("Feed achievements backfill failed: %s", e)
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    backfill_feed_achievements()
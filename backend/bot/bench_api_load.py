@@ -0,0 +1,96 @@
+"""
+Load benchmark of the HTTP API with many concurrent clients.
+
+    uvicorn app.main:app --port 8000 &
+    python bot/bench_api_load.py --url http://127.0.0.1:8000 --clients 200 --requests 4000
+
+Every client is a separate Telegram user (X-Telegram-Init-Data signed with the bot
+token from settings, so the server must run with the same TELEGRAM_BOT_TOKEN) and
+repeatedly requests --paths in a loop, so each request goes through get_current_user
+and the router queries. Prints throughput and latency percentiles per run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.security import sign_init_data  # type: ignore
+
+
+def init_data(telegram_id: int) -> str:
+    user = {"id": telegram_id, "first_name": f"Load {telegram_id}", "username": f"load{telegram_id}"}
+    return sign_init_data({"auth_date": str(int(time.time())), "user": json.dumps(user)})
+
+
+async def warm_up(session: aiohttp.ClientSession, args, telegram_id: int) -> None:
+    async with session.get(args.url + "/api/auth/me", headers={"X-Telegram-Init-Data": init_data(telegram_id)}) as resp:
+        await resp.read()
+
+
+async def client(session: aiohttp.ClientSession, args, telegram_id: int, queue: asyncio.Queue,
+                 latencies: list, statuses: Counter) -> None:
+    headers = {"X-Telegram-Init-Data": init_data(telegram_id)}
+    while True:
+        try:
+            path = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        started = time.monotonic()
+        try:
+            async with session.get(args.url + path, headers=headers) as resp:
+                await resp.read()
+                statuses[resp.status] += 1
+        except aiohttp.ClientError as e:
+            statuses[type(e).__name__] += 1
+        latencies.append(time.monotonic() - started)
+
+
+async def run(args) -> None:
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.clients)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        user_ids = [args.first_id + i for i in range(args.clients)]
+        # прогрев: пользователи создаются при первом запросе, в замер это не входит
+        await asyncio.gather(*(warm_up(session, args, uid) for uid in user_ids))
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(args.requests):
+            queue.put_nowait(args.paths[i % len(args.paths)])
+        latencies: list = []
+        statuses: Counter = Counter()
+
+        started = time.monotonic()
+        await asyncio.gather(*(client(session, args, uid, queue, latencies, statuses) for uid in user_ids))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"{args.clients} clients, {len(latencies)} requests in {elapsed:.2f}s: {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency ms: mean {statistics.mean(latencies) * 1000:.1f}, p50 {pct(0.5):.1f}, "
+          f"p95 {pct(0.95):.1f}, p99 {pct(0.99):.1f}")
+    print(f"statuses: {json.dumps({str(k): v for k, v in statuses.items()})}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--paths", nargs="+", default=["/api/habits", "/api/feed", "/api/friends"])
+    parser.add_argument("--first-id", type=int, default=900000000, help="telegram_id of the first load user")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
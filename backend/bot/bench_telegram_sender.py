@@ -0,0 +1,118 @@
+"""
+Benchmark of TelegramSender against a local fake Bot API server.
+
+    python bot/bench_telegram_sender.py --messages 300 --chats 100 --latency 0.05
+
+The fake server answers sendMessage after --latency seconds and returns 429 with
+retry_after for a --flood share of requests. The sequential baseline awaits one
+send at a time, as the worker did before.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bot.telegram_sender import TelegramSender  # type: ignore
+
+TOKEN = "123456:FAKE-TOKEN"
+
+
+def make_fake_api(latency: float, flood: float) -> web.Application:
+    counters = {"requests": 0, "flooded": 0}
+
+    async def handle(request: web.Request) -> web.Response:
+        counters["requests"] += 1
+        data = await request.post()
+        await asyncio.sleep(latency)
+        if random.random() < flood:
+            counters["flooded"] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+        chat_id = int(data.get("chat_id", 0))
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": counters["requests"],
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            },
+        })
+
+    app = web.Application()
+    app["counters"] = counters
+    app.router.add_post("/bot{token}/{method}", handle)
+    return app
+
+
+async def run(args) -> None:
+    app = make_fake_api(args.latency, args.flood)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{args.port}"))
+    bot = Bot(token=TOKEN, session=session)
+    chats = [100000 + i for i in range(args.chats)]
+    messages = [(random.choice(chats), f"message {i}") for i in range(args.messages)]
+
+    try:
+        if not args.skip_baseline:
+            started = time.monotonic()
+            for chat_id, text in messages:
+                try:
+                    await bot.send_message(chat_id=chat_id, text=text)
+                except Exception:
+                    pass
+            elapsed = time.monotonic() - started
+            print(f"sequential: {len(messages)} messages in {elapsed:.2f}s ({len(messages) / elapsed:.1f} msg/s)")
+
+        sender = TelegramSender(
+            bot,
+            concurrency=args.concurrency,
+            global_rate=args.global_rate,
+            chat_rate=args.chat_rate,
+            backoff_base=0.1,
+        )
+        started = time.monotonic()
+        results = await asyncio.gather(*(sender.send_message(chat_id, text) for chat_id, text in messages))
+        elapsed = time.monotonic() - started
+        ok = sum(1 for r in results if r.ok)
+        print(f"sender:     {ok}/{len(messages)} delivered in {elapsed:.2f}s ({len(messages) / elapsed:.1f} msg/s)")
+        print(f"sender stats: {json.dumps(dict(sender.stats))}; fake API: {json.dumps(app['counters'])}")
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Bot API response time, seconds")
+    parser.add_argument("--flood", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--global-rate", type=float, default=25.0)
+    parser.add_argument("--chat-rate", type=float, default=1.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--skip-baseline", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ import sys
 import logging
 from datetime import datetime, timedelta, date
 
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -30,7 +30,7 @@ def cleanup_old_notifications() -> None:
 
         deleted = (
             db.query(FeedEvent)
-            .filter(func.date(FeedEvent.created_at) <= cutoff_date)
+            .filter(FeedEvent.created_date < cutoff_date + timedelta(days=1))
             .delete(synchronize_session=False)
         )
         db.commit()
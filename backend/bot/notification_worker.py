@@ -2,10 +2,13 @@ import os
 import sys
 import time
 import asyncio
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, timezone
 import logging
-from sqlalchemy import create_engine, select, and_, func, or_
-from sqlalchemy.orm import sessionmaker, joinedload, Session
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
@@ -13,9 +16,14 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app.models.user import User
-from app.models.habit import Habit, HabitParticipant, HabitLog, FeedEvent
-from app.models.achievement import UserAchievement
+from app.models.habit import Habit, HabitParticipant, FeedEvent
+from app.models.reminder import ReminderSlot
+from app.models.scheduler import SchedulerCursor
 from app.core.config import settings
+from app.db.database import create_async_session_factory
+from app.services.streaks import alive_streak, load_user_states
+from app.services import calendar, reminders
+from bot.telegram_sender import TelegramSender, SendResult
 
 # New function to get achievement details
 def get_achievement_details(achievement_type: str, tier: int) -> dict:
@@ -52,8 +60,11 @@ DATABASE_URL = settings.DATABASE_URL
 TELEGRAM_BOT_TOKEN = settings.TELEGRAM_BOT_TOKEN
 MINI_APP_URL = settings.TELEGRAM_MINIAPP_LINK
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Own asyncpg pool: DB round trips overlap with Telegram sends instead of blocking the loop
+SessionLocal = create_async_session_factory(
+    pool_size=settings.WORKER_DB_POOL_SIZE,
+    max_overflow=settings.WORKER_DB_MAX_OVERFLOW,
+)
 
 def get_schedule_description(habit: Habit) -> str:
     """Returns a human-readable schedule for a habit."""
@@ -76,197 +87,307 @@ def get_schedule_description(habit: Habit) -> str:
 
     return "Нет расписания"
 
-async def send_notification(bot: Bot, user_id: int, message: str):
-    """Sends a notification to a user."""
-    try:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Открыть приложение", web_app={"url": settings.TELEGRAM_MINIAPP_LINK})]
-        ])
-        await bot.send_message(
-            chat_id=user_id,
-            text=message,
-            parse_mode="HTML",
-            reply_markup=keyboard
-        )
+async def send_notification(sender: TelegramSender, user_id: int, message: str) -> SendResult:
+    """Sends a notification to a user through the rate-limited sender."""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Открыть приложение", web_app={"url": settings.TELEGRAM_MINIAPP_LINK})]
+    ])
+    result = await sender.send_message(
+        user_id,
+        message,
+        parse_mode="HTML",
+        reply_markup=keyboard
+    )
+    if result.ok:
         logging.info(f"Sent notification to user {user_id}")
-        return True
-    except Exception as e:
-        logging.error(f"Failed to send notification to user {user_id}: {e}")
-        return False
-
-def calculate_streak(db: Session, habit_id: str, user_id: str) -> int:
-    """Calculates the current streak for a habit."""
-    logs = db.query(HabitLog.completed_at).filter(
-        HabitLog.habit_id == habit_id,
-        HabitLog.user_id == user_id
-    ).order_by(HabitLog.completed_at.desc()).all()
-
-    if not logs:
-        return 0
-
-    streak = 0
-    today = datetime.utcnow().date()
-    last_log_date = logs[0].completed_at.date()
-
-    # If the last log was today or yesterday, the streak is at least 1
-    if last_log_date == today or last_log_date == today - timedelta(days=1):
-        streak = 1
-        for i in range(len(logs) - 1):
-            if (logs[i].completed_at.date() - logs[i+1].completed_at.date()).days == 1:
-                streak += 1
-            else:
-                break
-    return streak
-
-async def check_habit_reminders(bot: Bot):
-    """Checks for habit reminders and sends notifications."""
+    return result
+
+async def gather_sends(sends) -> list:
+    """Runs sends concurrently; a send that still raises is logged and does not abort the others."""
+    results = await asyncio.gather(*sends, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logging.error(f"Notification send failed: {result!r}")
+    return results
+
+async def check_habit_reminders(sender: TelegramSender, minute: Optional[datetime] = None):
+    """Checks for habit reminders due in the given UTC minute (default: now) and sends notifications."""
     db = SessionLocal()
     try:
-        now_utc = datetime.utcnow()
-        today = now_utc.date()
-        current_weekday = today.isoweekday()
+        now_utc = minute or datetime.now(timezone.utc)
 
+        # Only reminders due in this UTC minute of the week (indexed reminder_slots);
+        # the slot already encodes the user's timezone and the habit's days of week.
         reminders_query = (
             select(Habit, User, HabitParticipant)
-            .join(HabitParticipant, Habit.id == HabitParticipant.habit_id)
-            .join(User, HabitParticipant.user_id == User.id)
+            .select_from(ReminderSlot)
+            .join(HabitParticipant, HabitParticipant.id == ReminderSlot.participant_id)
+            .join(Habit, Habit.id == ReminderSlot.habit_id)
+            .join(User, User.id == ReminderSlot.user_id)
             .where(
+                ReminderSlot.minute_of_week == reminders.minute_of_week(now_utc),
                 User.habit_reminders_enabled == True,
-                HabitParticipant.reminder_enabled == True,
-                HabitParticipant.reminder_time != None,
-                HabitParticipant.status == 'accepted'
             )
         )
-        
-        potential_reminders = db.execute(reminders_query).all()
 
+        potential_reminders = (await db.execute(reminders_query)).all()
+        if not potential_reminders:
+            return
+
+        # "Done today", "weekly goal met" and "current streak" for the whole tick in two
+        # set-based queries: bit calendars of the due (habit, user) pairs and their streak rows.
+        local_today = {
+            user.id: now_utc.astimezone(reminders.get_zone(user.timezone)).date()
+            for _, user, _ in potential_reminders
+        }
+        habit_ids = list({habit.id for habit, _, _ in potential_reminders})
+        user_ids = list(local_today)
+        years = set()
+        for today in local_today.values():
+            start_of_week = today - timedelta(days=today.weekday())
+            years.update({start_of_week.year, (start_of_week + timedelta(days=6)).year})
+        masks = await db.run_sync(calendar.load, habit_ids, years, user_ids)
+        streak_states = await db.run_sync(load_user_states, habit_ids, user_ids)
+
+        sends = []
         for habit, user, participant in potential_reminders:
-            reminder_time_str = participant.reminder_time
-            user_time = now_utc + timedelta(hours=3) # Assuming MSK
-            reminder_hour, reminder_minute = map(int, reminder_time_str.split(':'))
+            today = local_today[user.id]
+            start_of_week = today - timedelta(days=today.weekday())
+            end_of_week = start_of_week + timedelta(days=6)
+            week_days = [
+                d
+                for year in {start_of_week.year, end_of_week.year}
+                for d in calendar.days_from_int(year, masks.get((habit.id, user.id, year), 0), start_of_week, end_of_week)
+            ]
 
-            if not (user_time.hour == reminder_hour and user_time.minute == reminder_minute):
+            if today in week_days:
                 continue
 
-            # Schedule check
-            if habit.days_of_week and current_weekday not in habit.days_of_week:
-                continue
-            
             # Weekly goal check
-            if habit.frequency == 'weekly' and habit.weekly_goal_days:
-                start_of_week = today - timedelta(days=today.weekday())
-                logs_this_week = db.query(HabitLog).filter(
-                    HabitLog.habit_id == habit.id,
-                    HabitLog.user_id == user.id,
-                    HabitLog.completed_at >= start_of_week
-                ).count()
-                if logs_this_week >= habit.weekly_goal_days:
-                    continue
-
-            log_exists_today = db.query(HabitLog).filter(
-                HabitLog.habit_id == habit.id,
-                HabitLog.user_id == user.id,
-                func.date(HabitLog.completed_at) == today
-            ).first()
-            if log_exists_today:
+            if habit.frequency == 'weekly' and habit.weekly_goal_days and len(week_days) >= habit.weekly_goal_days:
                 continue
-            
-            streak = calculate_streak(db, habit.id, user.id)
+
+            streak = alive_streak(streak_states.get((habit.id, user.id)), today)
             message = (
                 f"🔔 Пора выполнить привычку: <b>{habit.name}</b>\n\n"
                 f"💬 {habit.description or 'Нет описания'}\n"
                 f"📆 {get_schedule_description(habit)}\n"
                 f"🔥 Серия: {streak} дней"
             )
-            await send_notification(bot, user.telegram_id, message)
+            sends.append(send_notification(sender, user.telegram_id, message))
+
+        # Messages go out concurrently; the sender enforces Telegram limits.
+        # A failed send must not keep the cursor on this minute (everyone would get it again).
+        await gather_sends(sends)
     finally:
-        db.close()
+        await db.close()
 
 
-async def check_feed_notifications(bot: Bot):
-    """Checks for new feed events and sends notifications."""
+async def refresh_reminder_slots(since: datetime, now: datetime):
+    """Recomputes reminder slots of users whose timezone switched to/from daylight saving time."""
     db = SessionLocal()
     try:
-        stmt = (
-            select(FeedEvent)
-            .options(
-                joinedload(FeedEvent.user),
-                joinedload(FeedEvent.actor),
-                joinedload(FeedEvent.habit)
-            )
-            .where(FeedEvent.notification_sent == False)
+        refreshed = await db.run_sync(reminders.refresh_changed_offsets, since, now)
+        await db.commit()
+        if refreshed:
+            logging.info(f"Refreshed reminder slots for {refreshed} users after a UTC offset change")
+    finally:
+        await db.close()
+
+
+def build_feed_message(event: FeedEvent) -> str:
+    """Returns the notification text for a feed event, or an empty string if there is nothing to send."""
+    if not event.actor or not event.user or event.actor_id == event.user_id:
+        return ""
+
+    if not event.user.feed_notifications_enabled:
+        return ""
+
+    actor_name = event.actor.first_name or event.actor.username
+    habit_name = f" «{event.habit.name}»" if event.habit else ""
+    habit_desc = f"💬 {event.habit.description}" if event.habit and event.habit.description else ""
+    habit_schedule = f"📆 {get_schedule_description(event.habit)}" if event.habit else ""
+    
+    message = ""
+    if event.event_type == "completed":
+        message = (
+            f"🎉 {actor_name} выполнил(а) привычку<b>{habit_name}</b>!\n\n"
+            f"{habit_desc}\n"
+            f"{habit_schedule}"
+        ).strip()
+    elif event.event_type == "joined":
+        message = (
+            f"👋 {actor_name} присоединился(лась) к вашей привычке<b>{habit_name}</b>\n\n"
+            f"{habit_desc}\n"
+            f"{habit_schedule}"
+        ).strip()
+    elif event.event_type == "left":
+         message = (
+            f"🚫 {actor_name} вышел(ла) из вашей привычки<b>{habit_name}</b>\n\n"
+            f"{habit_desc}\n"
+            f"{habit_schedule}"
+        ).strip()
+    elif event.event_type == "declined":
+         message = (
+            f"❌ {actor_name} отказался(лась) участвовать в вашей привычке<b>{habit_name}</b>\n\n"
+            f"{habit_desc}\n"
+            f"{habit_schedule}"
+        ).strip()
+    elif event.event_type == "invited":
+        message = (
+            f"👋 {actor_name} пригласил вас выполнять привычку<b>{habit_name}</b> вместе с ним!\n\n"
+            f"{habit_desc}\n"
+            f"{habit_schedule}"
+        ).strip()
+    elif event.event_type == "removed":
+        message = (
+            f"🚫 {actor_name} удалил вас из привычки<b>{habit_name}</b>.\n\n"
+            f"{habit_desc}\n"
+            f"{habit_schedule}"
+        ).strip()
+    elif event.event_type == "achievement":
+        user_achievement = event.achievement
+
+        if user_achievement:
+            details = get_achievement_details(user_achievement.type, user_achievement.tier)
+            tier_emoji = {1: "🥉", 2: "🥈", 3: "🥇"}.get(user_achievement.tier, "")
+            message = f"🏆 {actor_name} получил(а) новое достижение: <b>{details['name']}</b> {tier_emoji}"
+
+    return message
+
+
+async def claim_feed_batch(db: AsyncSession, batch_size: int):
+    """
+    Locks up to batch_size unsent events with FOR UPDATE SKIP LOCKED.
+
+    Rows locked by another worker (process or coroutine) are skipped, so parallel
+    workers never receive the same event; the partial index idx_feed_events_unsent keeps
+    the claim cheap however large feed_events grows.
+    """
+    stmt = (
+        select(FeedEvent)
+        .options(
+            joinedload(FeedEvent.user),
+            joinedload(FeedEvent.actor),
+            joinedload(FeedEvent.habit),
+            joinedload(FeedEvent.achievement)
         )
-        
-        events_to_notify = db.execute(stmt).scalars().all()
-        
-        for event in events_to_notify:
-            event.notification_sent = True
+        .where(FeedEvent.notification_sent == False)
+        .order_by(FeedEvent.created_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True, of=FeedEvent)
+    )
+    return (await db.execute(stmt)).scalars().all()
 
-            if not event.actor or not event.user or event.actor_id == event.user_id:
-                continue
-            
-            if not event.user.feed_notifications_enabled:
-                continue
 
-            actor_name = event.actor.first_name or event.actor.username
-            habit_name = f" «{event.habit.name}»" if event.habit else ""
-            habit_desc = f"💬 {event.habit.description}" if event.habit and event.habit.description else ""
-            habit_schedule = f"📆 {get_schedule_description(event.habit)}" if event.habit else ""
-            
-            message = ""
-            if event.event_type == "completed":
-                message = (
-                    f"🎉 {actor_name} выполнил(а) привычку<b>{habit_name}</b>!\n\n"
-                    f"{habit_desc}\n"
-                    f"{habit_schedule}"
-                ).strip()
-            elif event.event_type == "joined":
-                message = (
-                    f"👋 {actor_name} присоединился(лась) к вашей привычке<b>{habit_name}</b>\n\n"
-                    f"{habit_desc}\n"
-                    f"{habit_schedule}"
-                ).strip()
-            elif event.event_type == "left":
-                 message = (
-                    f"🚫 {actor_name} вышел(ла) из вашей привычки<b>{habit_name}</b>\n\n"
-                    f"{habit_desc}\n"
-                    f"{habit_schedule}"
-                ).strip()
-            elif event.event_type == "declined":
-                 message = (
-                    f"❌ {actor_name} отказался(лась) участвовать в вашей привычке<b>{habit_name}</b>\n\n"
-                    f"{habit_desc}\n"
-                    f"{habit_schedule}"
-                ).strip()
-            elif event.event_type == "invited":
-                message = (
-                    f"👋 {actor_name} пригласил вас выполнять привычку<b>{habit_name}</b> вместе с ним!\n\n"
-                    f"{habit_desc}\n"
-                    f"{habit_schedule}"
-                ).strip()
-            elif event.event_type == "removed":
-                message = (
-                    f"🚫 {actor_name} удалил вас из привычки<b>{habit_name}</b>.\n\n"
-                    f"{habit_desc}\n"
-                    f"{habit_schedule}"
-                ).strip()
-            elif event.event_type == "achievement":
-                user_achievement = db.query(UserAchievement).filter(
-                    UserAchievement.user_id == event.actor_id,
-                    UserAchievement.created_at >= event.created_at - timedelta(seconds=10)
-                ).order_by(UserAchievement.created_at.desc()).first()
-
-                if user_achievement:
-                    details = get_achievement_details(user_achievement.type, user_achievement.tier)
-                    tier_emoji = {1: "🥉", 2: "🥈", 3: "🥇"}.get(user_achievement.tier, "")
-                    message = f"🏆 {actor_name} получил(а) новое достижение: <b>{details['name']}</b> {tier_emoji}"
-
-            if message:
-                await send_notification(bot, event.user.telegram_id, message)
-        
-        db.commit()
+async def process_feed_batches(sender: TelegramSender, batch_size: int, max_batches: int) -> int:
+    """Claims and sends up to max_batches batches; each batch is its own transaction.
+
+    The cap keeps a large backlog from delaying the next minute's reminders: the rest waits for the next tick.
+    """
+    processed = 0
+    for _ in range(max_batches):
+        db = SessionLocal()
+        try:
+            events = await claim_feed_batch(db, batch_size)
+            if not events:
+                await db.rollback()
+                return processed
+
+            sends = []
+            for event in events:
+                message = build_feed_message(event)
+                if message:
+                    sends.append(send_notification(sender, event.user.telegram_id, message))
+            # A failed send must not roll back the batch: the delivered messages would be re-sent
+            await gather_sends(sends)
+
+            # The batch is marked sent in the same transaction that holds its locks:
+            # a crash before commit re-sends at most this batch.
+            for event in events:
+                event.notification_sent = True
+            await db.commit()
+            processed += len(events)
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            await db.close()
+    return processed
+
+
+async def check_feed_notifications(sender: TelegramSender):
+    """Checks for new feed events and sends notifications with FEED_NOTIFY_WORKERS parallel claimers."""
+    results = await asyncio.gather(*(
+        process_feed_batches(sender, settings.FEED_NOTIFY_BATCH_SIZE, settings.FEED_NOTIFY_MAX_BATCHES)
+        for _ in range(settings.FEED_NOTIFY_WORKERS)
+    ))
+    if sum(results):
+        logging.info(f"Processed {sum(results)} feed events")
+
+
+REMINDERS_CURSOR = "habit_reminders"
+
+
+def floor_minute(moment: datetime) -> datetime:
+    return moment.replace(second=0, microsecond=0)
+
+
+def seconds_until_next_minute(moment: datetime) -> float:
+    return 60 - moment.second - moment.microsecond / 1_000_000
+
+
+async def claim_reminders_cursor(db: AsyncSession, now_minute: datetime) -> Optional[SchedulerCursor]:
+    """
+    Locks the reminders cursor row; None if another worker process holds it.
+    A new cursor starts one minute before now, so the current minute is processed.
+    """
+    await db.execute(
+        pg_insert(SchedulerCursor)
+        .values(name=REMINDERS_CURSOR, last_minute=now_minute - timedelta(minutes=1))
+        .on_conflict_do_nothing(index_elements=[SchedulerCursor.name])
+    )
+    await db.commit()
+    return (await db.execute(
+        select(SchedulerCursor)
+        .where(SchedulerCursor.name == REMINDERS_CURSOR)
+        .with_for_update(skip_locked=True)
+        .execution_options(populate_existing=True)
+    )).scalar_one_or_none()
+
+
+async def process_due_minutes(sender: TelegramSender):
+    """
+    Processes every minute after the stored cursor up to the current one.
+
+    The cursor advances in its own transaction after each minute, so a slow tick or a
+    restart catches up on the missed minutes (at most REMINDER_CATCHUP_MINUTES back)
+    instead of skipping them. The row lock keeps parallel worker processes from
+    sending the same minute twice.
+    """
+    db = SessionLocal()
+    try:
+        while True:
+            now_minute = floor_minute(datetime.now(timezone.utc))
+            cursor = await claim_reminders_cursor(db, now_minute)
+            if cursor is None or cursor.last_minute >= now_minute:
+                await db.rollback()
+                return
+
+            next_minute = cursor.last_minute + timedelta(minutes=1)
+            oldest = now_minute - timedelta(minutes=settings.REMINDER_CATCHUP_MINUTES - 1)
+            if next_minute < oldest:
+                logging.warning(f"Skipping reminders from {next_minute} to {oldest}: older than the catch-up window")
+                next_minute = oldest
+
+            await check_habit_reminders(sender, next_minute)
+            cursor.last_minute = next_minute
+            await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
     finally:
-        db.close()
+        await db.close()
 
 
 async def main():
@@ -276,17 +397,24 @@ async def main():
         return
 
     bot = Bot(token=TELEGRAM_BOT_TOKEN)
-    
+    sender = TelegramSender(bot)
+
     logging.info("Notification worker started.")
-    
+    last_offset_check = datetime.now(timezone.utc)
+
     while True:
         try:
-            await check_habit_reminders(bot)
-            await check_feed_notifications(bot)
+            now = datetime.now(timezone.utc)
+            if now - last_offset_check >= timedelta(hours=1):
+                await refresh_reminder_slots(last_offset_check, now)
+                last_offset_check = now
+            await process_due_minutes(sender)
+            await check_feed_notifications(sender)
         except Exception as e:
             logging.error(f"An error occurred in the main loop: {e}")
-        
-        await asyncio.sleep(60) # Check every minute
+
+        # Wake on the next wall-clock minute boundary: work time does not accumulate as drift
+        await asyncio.sleep(seconds_until_next_minute(datetime.now(timezone.utc)))
 
 if __name__ == "__main__":
     asyncio.run(main())
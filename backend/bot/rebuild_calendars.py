@@ -0,0 +1,32 @@
+import os
+import sys
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.database import SessionLocal  # type: ignore
+from app.services import calendar, streaks  # type: ignore
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def rebuild_calendars() -> None:
+    db = SessionLocal()
+    try:
+        logging.info("Rebuilding habit calendars from habit_logs")
+        rows = calendar.rebuild_all(db)
+        logging.info("Built %d calendar rows, rebuilding streaks", rows)
+        # серии считаются по календарям, поэтому пересобираются следом
+        habits = streaks.rebuild_all(db)
+        db.commit()
+        logging.info("Rebuilt streaks for %d habits", habits)
+    except Exception as e:
+        logging.error("Calendar rebuild failed: %s", e)
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild_calendars()
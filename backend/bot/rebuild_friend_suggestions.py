@@ -0,0 +1,29 @@
+import os
+import sys
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.database import SessionLocal  # type: ignore
+from app.services import suggestions  # type: ignore
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def rebuild_friend_suggestions() -> None:
+    db = SessionLocal()
+    try:
+        logging.info("Rebuilding friend suggestions from friend_edges and habit_participants")
+        rows = suggestions.rebuild_all(db)
+        db.commit()
+        logging.info("Built %d friend suggestions", rows)
+    except Exception as e:
+        logging.error("Friend suggestions rebuild failed: %s", e)
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild_friend_suggestions()
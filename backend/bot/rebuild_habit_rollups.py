@@ -0,0 +1,29 @@
+import os
+import sys
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.database import SessionLocal  # type: ignore
+from app.services import rollups  # type: ignore
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def rebuild_habit_rollups() -> None:
+    db = SessionLocal()
+    try:
+        logging.info("Rebuilding daily and weekly habit rollups from habit_logs")
+        rows = rollups.rebuild_all(db)
+        db.commit()
+        logging.info("Built %d daily rollup rows", rows)
+    except Exception as e:
+        logging.error("Rollup rebuild failed: %s", e)
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild_habit_rollups()
@@ -0,0 +1,29 @@
+import os
+import sys
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.database import SessionLocal  # type: ignore
+from app.services import reminders  # type: ignore
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def rebuild_reminder_slots() -> None:
+    db = SessionLocal()
+    try:
+        logging.info("Rebuilding reminder slots from habit_participants")
+        slots = reminders.rebuild_all(db)
+        db.commit()
+        logging.info("Built %d reminder slots", slots)
+    except Exception as e:
+        logging.error("Reminder slots rebuild failed: %s", e)
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild_reminder_slots()
@@ -0,0 +1,29 @@
+import os
+import sys
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.database import SessionLocal  # type: ignore
+from app.services.streaks import rebuild_all  # type: ignore
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+def rebuild_streaks() -> None:
+    db = SessionLocal()
+    try:
+        logging.info("Rebuilding habit streaks from habit_logs")
+        habits = rebuild_all(db)
+        db.commit()
+        logging.info("Rebuilt streaks for %d habits", habits)
+    except Exception as e:
+        logging.error("Streak rebuild failed: %s", e)
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rebuild_streaks()
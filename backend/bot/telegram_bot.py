@@ -7,11 +7,18 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
+from sqlalchemy import select
 
 from app.core.config import settings
-from app.db.database import SessionLocal
+from app.db.database import create_async_session_factory
 from app.models import User
 
+# Отдельный небольшой пул asyncpg: запросы к БД не блокируют цикл событий бота
+SessionLocal = create_async_session_factory(
+    pool_size=settings.BOT_DB_POOL_SIZE,
+    max_overflow=settings.BOT_DB_MAX_OVERFLOW,
+)
+
 
 def build_webapp_url(ref_code: Optional[str] = None) -> str:
     """
@@ -41,8 +48,10 @@ async def cmd_start(message: Message) -> None:
 
   inviter_username = None
   if ref_code:
-      with SessionLocal() as db:
-          inviter = db.query(User).filter(User.referral_code == ref_code).first()
+      async with SessionLocal() as db:
+          inviter = (await db.execute(
+              select(User).where(User.referral_code == ref_code)
+          )).scalars().first()
           if inviter:
               inviter_username = inviter.username or inviter.first_name
 
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.core.config import settings  # type: ignore
+
+
+class TokenBucket:
+    """Token bucket: rate tokens per second, up to capacity in a burst."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class SendResult:
+    chat_id: int
+    ok: bool
+    attempts: int
+    error: Optional[str] = None
+    # True, если повторять бессмысленно (бот заблокирован, чат не найден, неверный запрос)
+    permanent: bool = False
+
+
+class TelegramSender:
+    """
+    Concurrent Telegram sender for the notification worker.
+
+    At most `concurrency` requests are in flight; the global bucket keeps the bot under
+    the Bot API broadcast limit and per-chat buckets under the per-chat limit. RetryAfter
+    pauses all sends for the requested time; network and 5xx errors are retried with
+    exponential backoff and jitter. Every message ends with a SendResult, counted in `stats`.
+    """
+
+    MAX_IDLE_CHAT_BUCKETS = 10000
+
+    def __init__(
+        self,
+        bot: Bot,
+        concurrency: int = settings.TELEGRAM_SEND_CONCURRENCY,
+        global_rate: float = settings.TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = settings.TELEGRAM_CHAT_RATE,
+        max_attempts: int = settings.TELEGRAM_SEND_ATTEMPTS,
+        backoff_base: float = 1.0,
+    ):
+        self.bot = bot
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base  # множитель задержек между повторами (секунды)
+        self.chat_rate = chat_rate
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._paused_until = 0.0
+        self.stats: Counter = Counter()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_IDLE_CHAT_BUCKETS:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, 1)
+        return bucket
+
+    async def _wait_pause(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> SendResult:
+        """Send one message honouring all limits; never raises: every failure ends in a SendResult."""
+        attempts = 0
+        retry_afters = 0
+        error = None
+        while attempts < self.max_attempts:
+            await self._chat_bucket(chat_id).acquire()
+            async with self._semaphore:
+                await self._wait_pause()
+                await self._global.acquire()
+                attempts += 1
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                    self.stats["sent"] += 1
+                    return SendResult(chat_id=chat_id, ok=True, attempts=attempts)
+                except TelegramRetryAfter as e:
+                    # flood control касается всего бота: приостанавливаем все отправки
+                    self.stats["retry_after"] += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                    error = f"RetryAfter {e.retry_after}s"
+                    retry_afters += 1
+                    if retry_afters <= self.max_attempts:
+                        attempts -= 1  # явная просьба подождать не расходует попытку
+                    continue
+                except (TelegramForbiddenError, TelegramNotFound, TelegramBadRequest) as e:
+                    self.stats["failed"] += 1
+                    logging.warning(f"Telegram rejected message to {chat_id}: {e}")
+                    return SendResult(chat_id=chat_id, ok=False, attempts=attempts, error=str(e), permanent=True)
+                except (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError) as e:
+                    self.stats["retried"] += 1
+                    error = str(e)
+                except TelegramAPIError as e:
+                    # прочие ответы Bot API (Unauthorized, Conflict, ...): повтор в этом же тике не поможет
+                    self.stats["failed"] += 1
+                    logging.error(f"Telegram API error for {chat_id}: {e!r}")
+                    return SendResult(chat_id=chat_id, ok=False, attempts=attempts, error=repr(e))
+                except Exception as e:
+                    # ошибка отправки одного сообщения не должна срывать пакет рассылки
+                    self.stats["failed"] += 1
+                    logging.exception(f"Unexpected error sending message to {chat_id}")
+                    return SendResult(chat_id=chat_id, ok=False, attempts=attempts, error=repr(e))
+            if attempts < self.max_attempts:
+                await asyncio.sleep(min(2 ** attempts, 30) * (0.5 + random.random()) * self.backoff_base)
+
+        self.stats["failed"] += 1
+        logging.error(f"Failed to send message to {chat_id} after {attempts} attempts: {error}")
+        return SendResult(chat_id=chat_id, ok=False, attempts=attempts, error=error)
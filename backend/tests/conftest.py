@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.db.database import Base, engine  # noqa: E402
+import app.models  # noqa: E402,F401  регистрация моделей в Base.metadata
+
+
+@pytest.fixture(scope="session")
+def database():
+    """PostgreSQL из DATABASE_URL со схемой приложения; без доступной БД тесты пропускаются."""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except OperationalError as e:
+        pytest.skip(f"PostgreSQL is not available: {e}")
+    Base.metadata.create_all(bind=engine)
+    return engine
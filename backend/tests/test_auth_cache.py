@@ -0,0 +1,49 @@
+import asyncio
+import json
+import time
+import urllib.parse
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from app.core import security
+
+
+def _init_data(user_id: int, first_name: str) -> str:
+    return security.sign_init_data({
+        "auth_date": str(int(time.time())),
+        "user": json.dumps({"id": user_id, "first_name": first_name}),
+    })
+
+
+def test_cached_session_requires_same_init_data():
+    """Кэш проверенных сессий не срабатывает на чужие поля с уже проверенным hash."""
+    verified = _init_data(101, "alice")
+    security._verified_users.set(security._init_data_key(verified), uuid.uuid4())
+
+    # тот же hash, но другой пользователь: подпись должна проверяться заново и не сойтись
+    fields = dict(urllib.parse.parse_qsl(verified))
+    fields["user"] = json.dumps({"id": 202, "first_name": "mallory"})
+    forged = urllib.parse.urlencode(fields)
+
+    try:
+        with pytest.raises(HTTPException) as exc:
+            # до БД дело не доходит: проверка подписи отклоняет запрос раньше
+            asyncio.run(security.get_current_user(x_telegram_init_data=forged, db=None))
+        assert exc.value.status_code == 401
+    finally:
+        security._verified_users.clear()
+
+
+def test_blank_init_data_value_is_signed():
+    """Поле с пустым значением участвует в подписи и не ломает проверку."""
+    init_data = security.sign_init_data({
+        "auth_date": str(int(time.time())),
+        "start_param": "",
+        "user": json.dumps({"id": 303, "first_name": "bob"}),
+    })
+
+    data = security.verify_telegram_auth(init_data)
+    assert data["id"] == 303
+    assert not data["start_param"]
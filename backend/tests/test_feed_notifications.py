@@ -0,0 +1,69 @@
+import asyncio
+import random
+from collections import Counter
+
+from aiogram.exceptions import TelegramConflictError
+from aiogram.methods import SendMessage
+
+from app.db.database import SessionLocal
+from app.models import User, FeedEvent
+from bot import notification_worker
+from bot.telegram_sender import TelegramSender
+
+
+class FakeBot:
+    """Bot API stub: records deliveries, raises the configured error for some chats."""
+
+    def __init__(self, failures: dict):
+        self.failures = failures
+        self.calls = Counter()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls[chat_id] += 1
+        if chat_id in self.failures:
+            raise self.failures[chat_id]
+
+
+def test_unlisted_send_error_does_not_resend_the_batch(database):
+    """Ошибка вне обрабатываемых явно не откатывает пакет: каждое событие отмечается и отправляется один раз."""
+    db = SessionLocal()
+    base_id = random.randint(10 ** 12, 10 ** 13)
+    actor = User(telegram_id=base_id, first_name="actor")
+    recipients = [User(telegram_id=base_id + i + 1, first_name=f"r{i}") for i in range(3)]
+    db.add_all([actor, *recipients])
+    db.flush()
+    events = [FeedEvent(user_id=r.id, actor_id=actor.id, event_type="completed") for r in recipients]
+    db.add_all(events)
+    db.commit()
+    user_ids = [actor.id, *(r.id for r in recipients)]
+    event_ids = [e.id for e in events]
+    chats = [r.telegram_id for r in recipients]
+    db.close()
+
+    conflict = TelegramConflictError(method=SendMessage(chat_id=chats[0], text="x"), message="Conflict")
+    bot = FakeBot({chats[0]: conflict, chats[1]: RuntimeError("boom")})
+    sender = TelegramSender(bot, concurrency=4, global_rate=1000, chat_rate=1000, max_attempts=2, backoff_base=0)
+
+    async def run_twice():
+        try:
+            await notification_worker.process_feed_batches(sender, batch_size=50, max_batches=10)
+            # второй проход: отмеченный пакет больше не захватывается
+            await notification_worker.process_feed_batches(sender, batch_size=50, max_batches=10)
+        finally:
+            await notification_worker.SessionLocal.kw["bind"].dispose()
+
+    try:
+        asyncio.run(run_twice())
+
+        assert [bot.calls[chat] for chat in chats] == [1, 1, 1]
+        db = SessionLocal()
+        try:
+            sent = db.query(FeedEvent.notification_sent).filter(FeedEvent.id.in_(event_ids)).all()
+            assert [row[0] for row in sent] == [True] * len(event_ids)
+        finally:
+            db.close()
+    finally:
+        db = SessionLocal()
+        db.query(User).filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.commit()
+        db.close()
@@ -0,0 +1,77 @@
+import asyncio
+import random
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.api.habits import get_habits
+from app.db.database import SessionLocal, create_async_session_factory
+from app.models import User, Habit, HabitParticipant
+from app.services import calendar, streaks
+
+
+def _create_user_with_habits(habit_count: int, friend_count: int) -> list:
+    """Пользователь с habit_count привычками; в каждой ещё friend_count принятых участников и отметки."""
+    db = SessionLocal()
+    try:
+        base_id = random.randint(10 ** 12, 10 ** 13)
+        owner = User(telegram_id=base_id, first_name="owner")
+        friends = [User(telegram_id=base_id + i + 1, first_name=f"friend{i}") for i in range(friend_count)]
+        db.add_all([owner, *friends])
+        db.flush()
+        for n in range(habit_count):
+            habit = Habit(name=f"habit {n}", created_by=owner.id, is_shared=bool(friends))
+            db.add(habit)
+            db.flush()
+            for user in [owner, *friends]:
+                db.add(HabitParticipant(habit_id=habit.id, user_id=user.id, status="accepted", color="gold"))
+                for days_ago in range(3):
+                    calendar.mark_day(db, habit.id, user.id, date.today() - timedelta(days=days_ago))
+            db.flush()
+            streaks.recompute_joint_streak(db, habit.id)
+        db.commit()
+        return [owner.id, *(f.id for f in friends)]
+    finally:
+        db.close()
+
+
+def _delete_users(user_ids: list) -> None:
+    db = SessionLocal()
+    try:
+        db.query(User).filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _count_list_queries(owner_id) -> tuple:
+    session_factory = create_async_session_factory(pool_size=1, max_overflow=0)
+    async_engine = session_factory.kw["bind"]
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        async with session_factory() as db:
+            current_user = await db.get(User, owner_id)
+            statements.clear()
+            payloads = await get_habits(current_user=current_user, db=db)
+            return len(payloads), len(statements)
+    finally:
+        await async_engine.dispose()
+
+
+def test_habit_list_query_count_does_not_grow_with_habits(database):
+    solo = _create_user_with_habits(habit_count=2, friend_count=0)
+    shared = _create_user_with_habits(habit_count=12, friend_count=3)
+    try:
+        solo_habits, solo_queries = asyncio.run(_count_list_queries(solo[0]))
+        shared_habits, shared_queries = asyncio.run(_count_list_queries(shared[0]))
+    finally:
+        _delete_users(solo + shared)
+
+    assert (solo_habits, shared_habits) == (2, 12)
+    assert shared_queries == solo_queries
+    assert solo_queries <= 5
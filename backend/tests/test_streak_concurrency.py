@@ -0,0 +1,64 @@
+import random
+import threading
+import time
+from datetime import date
+
+from app.db.database import SessionLocal
+from app.models import User, Habit, HabitParticipant, HabitJointStreak
+from app.services import calendar, streaks
+
+
+def test_parallel_first_completions_create_streak_rows_once(database):
+    """Первые отметки двух участников в параллельных транзакциях: строка совместной серии создаётся без IntegrityError."""
+    db = SessionLocal()
+    base_id = random.randint(10 ** 12, 10 ** 13)
+    users = [User(telegram_id=base_id + i, first_name=f"u{i}") for i in range(2)]
+    db.add_all(users)
+    db.flush()
+    habit = Habit(name="shared", created_by=users[0].id, is_shared=True)
+    db.add(habit)
+    db.flush()
+    for user in users:
+        db.add(HabitParticipant(habit_id=habit.id, user_id=user.id, status="accepted"))
+    db.commit()
+    habit_id, user_ids = habit.id, [u.id for u in users]
+    db.close()
+
+    today = date.today()
+    barrier = threading.Barrier(len(user_ids))
+    errors = []
+
+    def complete(user_id):
+        session = SessionLocal()
+        try:
+            calendar.mark_day(session, habit_id, user_id, today)
+            barrier.wait()
+            streaks.record_completion(session, habit_id, user_id, today)
+            # держим транзакцию открытой, пока вторая доходит до создания строки серии
+            time.sleep(0.3)
+            session.commit()
+        except Exception as e:
+            errors.append(e)
+            session.rollback()
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=complete, args=(user_id,)) for user_id in user_ids]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        db = SessionLocal()
+        try:
+            joint = db.query(HabitJointStreak).filter(HabitJointStreak.habit_id == habit_id).one()
+            assert errors == []
+            assert (joint.current_streak, joint.max_streak) == (1, 1)
+        finally:
+            db.close()
+    finally:
+        db = SessionLocal()
+        db.query(User).filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.commit()
+        db.close()
@@ -46,12 +46,13 @@ CREATE TABLE habit_logs (
     habit_id UUID NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
     user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_date DATE GENERATED ALWAYS AS (DATE(completed_at)) STORED,
     notes TEXT
 );
 
 -- Уникальный индекс для предотвращения дублирования выполнений в один день
-CREATE UNIQUE INDEX idx_habit_logs_unique_daily 
-ON habit_logs(habit_id, user_id, DATE(completed_at));
+CREATE UNIQUE INDEX idx_habit_logs_habit_user_date
+ON habit_logs(habit_id, user_id, completed_date);
 
 -- Дружеские связи
 CREATE TABLE friendships (
@@ -83,8 +84,7 @@ CREATE INDEX idx_habits_created_by ON habits(created_by);
 CREATE INDEX idx_habit_participants_habit_id ON habit_participants(habit_id);
 CREATE INDEX idx_habit_participants_user_id ON habit_participants(user_id);
 CREATE INDEX idx_habit_logs_habit_id ON habit_logs(habit_id);
-CREATE INDEX idx_habit_logs_user_id ON habit_logs(user_id);
-CREATE INDEX idx_habit_logs_date ON habit_logs(DATE(completed_at));
+CREATE INDEX idx_habit_logs_user_date ON habit_logs(user_id, completed_date);
 CREATE INDEX idx_friendships_user_id ON friendships(user_id);
 CREATE INDEX idx_friendships_friend_id ON friendships(friend_id);
 CREATE INDEX idx_friendships_status ON friendships(status);
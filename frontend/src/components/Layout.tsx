@@ -1,6 +1,6 @@
 import { ReactNode, useEffect, useRef, useState } from 'react'
 import { useLocation } from 'react-router-dom'
-import { authApi } from '../services/api'
+import { authApi, profileApi } from '../services/api'
 import BottomMenu from './BottomMenu'
 import './Layout.css'
 
@@ -17,7 +17,12 @@ function Layout({ children }: LayoutProps) {
   useEffect(() => {
     const loadUser = async () => {
       try {
-        await authApi.getMe()
+        const me = await authApi.getMe()
+        // Пояс устройства нужен бэкенду, чтобы присылать напоминания по местному времени
+        const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone
+        if (me && timezone && me.timezone !== timezone) {
+          await profileApi.update({ timezone })
+        }
       } catch (error) {
         console.error('Failed to load user:', error)
       } finally {
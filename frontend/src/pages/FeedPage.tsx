@@ -1,6 +1,6 @@
 import { useEffect, useMemo, useState } from 'react'
 import * as QRCode from 'qrcode'
-import { friendsApi, feedApi } from '../services/api'
+import { friendsApi, feedApi, FeedEvent } from '../services/api'
 import './FeedPage.css'
 
 function FeedPage() {
@@ -8,14 +8,9 @@ function FeedPage() {
   const [inviteUrl, setInviteUrl] = useState<string>('')
   const [qrUrl, setQrUrl] = useState<string>('')
   const [inviteLoading, setInviteLoading] = useState(false)
-  const [feed, setFeed] = useState<Array<{
-    id: string
-    event_type: string
-    created_at: string
-    habit?: { id: string; name: string } | null
-    actor?: { id: string; username?: string; first_name?: string; last_name?: string; avatar_emoji: string } | null
-    achievement?: { type: string; tier: number } | null
-  }>>([])
+  const [feed, setFeed] = useState<FeedEvent[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [hasFriends, setHasFriends] = useState(false)
   const [page, setPage] = useState(0)
   const pageSize = 20
@@ -23,8 +18,9 @@ function FeedPage() {
   useEffect(() => {
     const loadFeed = async () => {
       try {
-        const data = await feedApi.getAll()
-        setFeed(data)
+        const data = await feedApi.getPage(null, pageSize * 2)
+        setFeed(data.items)
+        setNextCursor(data.next_cursor)
         setPage(0)
       } catch (e) {
         console.error('Failed to load feed', e)
@@ -67,6 +63,27 @@ function FeedPage() {
     loadFriends()
   }, [])
 
+  // Следующая страница ленты подгружается, когда пользователь дошёл до конца загруженной
+  const showOlder = async () => {
+    const nextPage = page + 1
+    if (nextPage * pageSize < feed.length) {
+      setPage(nextPage)
+      return
+    }
+    if (!nextCursor || loadingMore) return
+    setLoadingMore(true)
+    try {
+      const data = await feedApi.getPage(nextCursor, pageSize * 2)
+      setFeed((prev) => [...prev, ...data.items])
+      setNextCursor(data.next_cursor)
+      if (data.items.length > 0) setPage(nextPage)
+    } catch (e) {
+      console.error('Failed to load feed', e)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const grouped = useMemo(() => {
     const sorted = [...feed].sort((a, b) => (a.created_at < b.created_at ? 1 : -1))
     const start = page * pageSize
@@ -165,7 +182,7 @@ function FeedPage() {
                 </ul>
               </div>
             ))}
-            {grouped.total > pageSize && (
+            {(grouped.total > pageSize || nextCursor) && (
               <div className="feed-pagination">
                 <button
                   type="button"
@@ -176,15 +193,13 @@ function FeedPage() {
                   ← Новые
                 </button>
                 <span className="feed-page-counter">
-                  {page + 1} / {Math.ceil(grouped.total / pageSize)}
+                  {page + 1} / {Math.ceil(grouped.total / pageSize)}{nextCursor ? '+' : ''}
                 </span>
                 <button
                   type="button"
                   className="feed-page-btn"
-                  disabled={(page + 1) * pageSize >= grouped.total}
-                  onClick={() =>
-                    setPage((p) => ((p + 1) * pageSize >= grouped.total ? p : p + 1))
-                  }
+                  disabled={((page + 1) * pageSize >= grouped.total && !nextCursor) || loadingMore}
+                  onClick={showOlder}
                 >
                   Ранее →
                 </button>
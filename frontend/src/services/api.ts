@@ -1,5 +1,5 @@
 import axios from 'axios'
-import type { User, Habit, HabitLog, Friendship, HabitStats } from '../types'
+import type { User, Habit, HabitLog, Friendship, HabitStats, StatsResolution } from '../types'
 
 const API_URL = import.meta.env.VITE_API_URL || '/api'
 
@@ -125,6 +125,12 @@ export const habitsApi = {
 }
 
 // Friends
+export type FriendSuggestion = {
+  user: { id: string; username?: string; first_name?: string; last_name?: string; bio?: string; avatar_emoji: string }
+  mutual_friends: number
+  shared_habits: number
+}
+
 export const friendsApi = {
   getAll: async (): Promise<Friendship[]> => {
     const response = await api.get('/friends')
@@ -135,6 +141,11 @@ export const friendsApi = {
     const response = await api.get('/friends/invite')
     return response.data
   },
+
+  getSuggestions: async (limit: number = 20): Promise<FriendSuggestion[]> => {
+    const response = await api.get(`/friends/suggestions?limit=${limit}`)
+    return response.data
+  },
   
   add: async (userId: string): Promise<void> => {
     await api.post(`/friends/${userId}`)
@@ -147,8 +158,22 @@ export const friendsApi = {
 
 // Stats
 export const statsApi = {
-  getHabitStats: async (habitId: string, days: number = 30): Promise<HabitStats> => {
-    const response = await api.get(`/stats/habits/${habitId}?days=${days}`)
+  // resolution не указан — сервер выбирает детализацию по длине окна
+  getHabitStats: async (habitId: string, days: number = 30, resolution?: StatsResolution): Promise<HabitStats> => {
+    const params = new URLSearchParams()
+    params.set('days', String(days))
+    if (resolution) params.set('resolution', resolution)
+    const response = await api.get(`/stats/habits/${habitId}?${params.toString()}`)
+    return response.data
+  },
+
+  // Статистика нескольких привычек одним запросом; без habitIds — все привычки пользователя
+  getHabitsStats: async (habitIds?: string[], days: number = 30, resolution?: StatsResolution): Promise<HabitStats[]> => {
+    const params = new URLSearchParams()
+    if (habitIds) params.set('ids', habitIds.join(','))
+    params.set('days', String(days))
+    if (resolution) params.set('resolution', resolution)
+    const response = await api.get(`/stats/habits?${params.toString()}`)
     return response.data
   },
 
@@ -162,19 +187,33 @@ export const statsApi = {
     const response = await api.get(`/stats/yearly?${params.toString()}`)
     return response.data
   },
+
+  // Календари года всех привычек: habit_id -> base64 46 байт, бит n (байт n >> 3, бит n & 7) — день n от 1 января
+  getYearlyHeatmap: async (
+    year: number
+  ): Promise<{ year: number; years: number[]; habits: Record<string, string> }> => {
+    const response = await api.get(`/stats/yearly/heatmap?year=${year}`)
+    return response.data
+  },
 }
 
 // Feed
+export type FeedEvent = {
+  id: string
+  event_type: string
+  created_at: string
+  habit?: { id: string; name: string } | null
+  actor?: { id: string; username?: string; first_name?: string; last_name?: string; avatar_emoji: string } | null
+  achievement?: { type: string; tier: number } | null
+}
+
 export const feedApi = {
-  getAll: async (): Promise<Array<{
-    id: string
-    event_type: string
-    created_at: string
-    habit?: { id: string; name: string } | null
-    actor?: { id: string; username?: string; first_name?: string; last_name?: string; avatar_emoji: string } | null
-    achievement?: { type: string; tier: number } | null
-  }>> => {
-    const response = await api.get('/feed')
+  // Страница ленты от новых к старым; before — next_cursor предыдущей страницы
+  getPage: async (before?: string | null, limit = 50): Promise<{ items: FeedEvent[]; next_cursor: string | null }> => {
+    const params = new URLSearchParams()
+    params.set('limit', String(limit))
+    if (before) params.set('before', before)
+    const response = await api.get(`/feed?${params.toString()}`)
     return response.data
   },
 }
@@ -203,6 +242,7 @@ export const profileApi = {
     avatar_emoji?: string
     bio?: string
     first_day_of_week?: string
+    timezone?: string
     habit_reminders_enabled?: boolean
     feed_notifications_enabled?: boolean
   }): Promise<User> => {
@@ -8,6 +8,8 @@ export interface User {
   bio?: string
   /** monday | sunday — первый день недели в календаре */
   first_day_of_week?: string
+  /** IANA-пояс, например Europe/Moscow — по нему считаются напоминания */
+  timezone?: string
   habit_reminders_enabled?: boolean
   feed_notifications_enabled?: boolean
   created_at: string
@@ -90,6 +92,7 @@ export interface Friendship {
 export interface HabitStats {
   habit_id: string
   total_completions: number
+  /** Самая длинная серия дней подряд внутри периода (для совместных — по общим дням участников) */
   current_streak: number
   /** Дней выполнено сверх расписания (не в запланированный день или сверх цели по неделе) */
   above_norm_count?: number
@@ -101,7 +104,12 @@ export interface HabitStats {
     date: string
     user_id: string
     color?: HabitColor
+    count?: number
   }>
   period_days: number
+  /** Детализация ряда: для week/month date — начало периода, count — дней в нём */
+  resolution?: StatsResolution
 }
 
+export type StatsResolution = 'day' | 'week' | 'month'
+